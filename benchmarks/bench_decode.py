@@ -0,0 +1,101 @@
+"""
+BodyShapeEstimator ingest 단계 benchmark (conda 환경에서 실행, 모델은 로드하지 않음)
+
+python -m benchmarks.bench_decode [<image> ...] [--chunk 8] [--repeat 5] [--max-side 1280]
+
+이미지를 주지 않으면 12MP(4032x3024) 합성 JPEG으로 측정합니다.
+- before: cv2.imread로 원본 해상도 디코딩 후 YOLO 입력으로 resize (chunk의 이미지를 모두 들고 있음)
+- after: read_image()로 IMREAD_REDUCED_* 디코딩 + 해상도 cap, 미리 할당한 buffer 재사용
+chunk 하나를 처리하는 동안의 이미지당 latency와 numpy 배열 peak 메모리(tracemalloc)를 비교합니다.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from recommender.body_shape_estimator import ImageBuffers, read_image
+
+YOLO_SIZE = (416, 416)
+
+
+def synthetic_jpeg(path, width=4032, height=3024):
+    """
+    phone photo sized JPEG: smooth gradient with noise, so it compresses like a photo
+    """
+    xs = np.linspace(0, 255, width, dtype=np.float32)
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    rng = np.random.default_rng(0)
+    for c, (a, b) in enumerate(((1.0, 0.0), (0.0, 1.0), (0.5, 0.5))):
+        channel = a * xs + b * ys + rng.normal(0, 8, (height, width)).astype(np.float32)
+        img[:, :, c] = np.clip(channel, 0, 255)
+    cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+
+def run_chunk(decode, img_paths):
+    """
+    decode a chunk like _estimate_chunk does, return seconds and peak traced bytes
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    images = [decode(i, img_path) for i, img_path in enumerate(img_paths)]
+    for img in images:
+        cv2.cvtColor(cv2.resize(img, YOLO_SIZE), cv2.COLOR_BGR2RGB)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--chunk", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-side", type=int, default=1280)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        img_paths = args.images
+        if len(img_paths) == 0:
+            img_path = os.path.join(tmp_dir, "12mp.jpg")
+            synthetic_jpeg(img_path)
+            img_paths = [img_path]
+        chunk = [img_paths[i % len(img_paths)] for i in range(args.chunk)]
+
+        buffers = ImageBuffers()
+        modes = {
+            "before": lambda i, img_path: cv2.imread(img_path),
+            "after": lambda i, img_path: read_image(
+                img_path, max_side=args.max_side, buffers=buffers, key=("ingest", i)
+            )[0],
+        }
+
+        full = cv2.imread(chunk[0])
+        capped = modes["after"](0, chunk[0])
+        print(f"working resolution: {full.shape[1]}x{full.shape[0]} -> {capped.shape[1]}x{capped.shape[0]}")
+
+        results = {}
+        for name, decode in modes.items():
+            run_chunk(decode, chunk)  # warm up, fills the buffers
+            runs = [run_chunk(decode, chunk) for _ in range(args.repeat)]
+            seconds = min(s for s, _ in runs)
+            peak = max(p for _, p in runs)
+            results[name] = (seconds / len(chunk), peak)
+            print(
+                f"{name:>8}: {seconds / len(chunk) * 1000:8.1f} ms/image, "
+                f"peak {peak / 2**20:8.1f} MiB per chunk of {len(chunk)}"
+            )
+
+    print(
+        f"latency: {results['before'][0] / results['after'][0]:.2f}x faster, "
+        f"memory: {results['before'][1] / max(results['after'][1], 1):.1f}x less"
+    )
+
+
+if __name__ == "__main__":
+    main()
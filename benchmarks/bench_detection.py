@@ -0,0 +1,73 @@
+"""
+BodyShapeEstimator 검출 단계 micro-benchmark (conda 환경에서 실행)
+
+python -m benchmarks.bench_detection <image> [<image> ...] [--repeat N]
+
+- before: 기존 estimate()처럼 YOLO를 두 번 실행하고 namesfile을 매번 읽음
+- after: YOLO 한 번 실행
+- cached: 같은 이미지를 다시 추정할 때 (detection cache hit)
+"""
+import argparse
+import time
+
+from recommender.body_shape_estimator import BodyShapeEstimator, read_image
+
+
+def time_per_image(fn, img_paths, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for img_path in img_paths:
+            fn(img_path)
+    return (time.perf_counter() - start) / (repeat * len(img_paths))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # import the modules that require the conda environment
+    import cv2
+    from YOLOv4.tool.utils import load_class_names
+    from YOLOv4.tool.torch_utils import do_detect
+
+    bse = BodyShapeEstimator()
+    bse.warmup()
+
+    def before(img_path):
+        orig_img = cv2.imread(img_path)
+        yolo_input_img = cv2.resize(orig_img, (bse.width, bse.height))
+        yolo_input_img = cv2.cvtColor(yolo_input_img, cv2.COLOR_BGR2RGB)
+        for i in range(2):
+            boxes = do_detect(bse.yolo, yolo_input_img, 0.4, 0.6, use_cuda=False)
+        load_class_names(bse.namesfile)
+        return boxes[0]
+
+    def after(img_path):
+        orig_img, _ = read_image(img_path)
+        return bse.detect(orig_img)
+
+    def cached(img_path):
+        orig_img, content_hash = read_image(img_path)
+        return bse.detect(orig_img, content_hash)
+
+    # fill the cache before measuring the cached case
+    for img_path in args.images:
+        cached(img_path)
+
+    results = {
+        "before": time_per_image(before, args.images, args.repeat),
+        "after": time_per_image(after, args.images, args.repeat),
+        "cached": time_per_image(cached, args.images, args.repeat),
+    }
+    for name, seconds in results.items():
+        print(f"{name:>8}: {seconds * 1000:8.1f} ms/image")
+    print(
+        f"speedup: {results['before'] / results['after']:.2f}x (single pass), "
+        f"{results['before'] / results['cached']:.2f}x (cached)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+체형 인덱스 검색 latency benchmark (합성 리뷰)
+
+python -m benchmarks.bench_index [--sizes 10000 100000 1000000] [--queries 200] [--k 20]
+
+인덱스 크기별로 exact / ivf backend의 query latency와 ivf의 recall@k를 출력
+"""
+import argparse
+import time
+
+import numpy as np
+
+from recommender.body_shape_index import BodyShapeIndex
+
+
+def synthetic_reviews(n, rng):
+    return (
+        np.arange(1, n + 1),
+        rng.normal(size=(n, 10)).astype(np.float32),
+        rng.choice(["M", "F"], size=n),
+        rng.uniform(150, 190, size=n),
+        rng.integers(1, 1000, size=n),
+    )
+
+
+def time_queries(index, queries, k, **filters):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query, k=k, **filters)[0])
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--n-probe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.normal(size=(args.queries, 10))
+    filters = {"gender": "F", "min_height": 160, "max_height": 175}
+
+    print(f"{'size':>9} {'exact':>10} {'ivf':>10} {'filtered':>10} {'recall':>7} {'build':>8}")
+    for size in args.sizes:
+        reviews = synthetic_reviews(size, rng)
+        exact = BodyShapeIndex.build(*reviews, backend="exact")
+
+        start = time.perf_counter()
+        ivf = BodyShapeIndex.build(*reviews, backend="ivf")
+        build_time = time.perf_counter() - start
+        ivf.n_probe = args.n_probe
+
+        exact_time, exact_results = time_queries(exact, queries, args.k)
+        ivf_time, ivf_results = time_queries(ivf, queries, args.k)
+        filtered_time, _ = time_queries(ivf, queries, args.k, **filters)
+
+        recall = np.mean(
+            [
+                len(np.intersect1d(e, i)) / args.k
+                for e, i in zip(exact_results, ivf_results)
+            ]
+        )
+        print(
+            f"{size:>9} {exact_time * 1000:>8.2f}ms {ivf_time * 1000:>8.2f}ms "
+            f"{filtered_time * 1000:>8.2f}ms {recall:>7.3f} {build_time:>7.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+scraper html 파싱 benchmark: parser별(html.parser / lxml) 전체 파싱과 부분 파싱(SoupStrainer) 처리량 비교
+
+python -m benchmarks.bench_parsing [--reviews 100] [--filler 2000] [--repeat 20]
+
+합성 리뷰 목록 / 상품 페이지로 pages/s 출력
+파싱 결과가 이전 parser와 같은지는 저장한 실제 응답으로 scraper/tests.py에서 확인 (python manage.py test scraper)
+"""
+import argparse
+import time
+
+from scraper.parsing import REVIEW_LIST_ONLY, SIZE_TABLE_ONLY, make_soup
+from scraper.scraper import parse_review_list, to_size_dict_list
+
+PARSERS = ["html.parser", "lxml"]
+
+
+def filler_html(n):
+    # navigation, scripts and recommendations surrounding the part the scraper reads
+    return "".join(
+        f'<li class="nav-item"><a href="/app/goods/{i}"><span>추천 상품 {i}</span></a></li>'
+        for i in range(n)
+    )
+
+
+def review_list_page(num_reviews, filler):
+    reviews = []
+    for i in range(num_reviews):
+        gender = "남성" if i % 2 == 0 else "여성"
+        body = f"{gender} · {160 + i % 30}cm · {50 + i % 40}kg"
+        if i % 7 == 0:
+            body = "비공개"  # hidden / malformed body size
+        photo = (
+            ""
+            if i % 5 == 0
+            else f'<ul class="review-content-photo__list"><li><img src="//image.msscdn.net/{i}.jpg"></li></ul>'
+        )
+        reviews.append(
+            '<div class="review-list">'
+            f'<p class="review-profile__body_information">{body}</p>'
+            f'<span class="review-goods-information__option">{"SML"[i % 3]}</span>'
+            f'<div class="review-contents__text"> 리뷰 내용 {i} &amp; 사이즈 좋아요 </div>'
+            f"{photo}</div>"
+        )
+    return (
+        f"<html><head><script>var x = '<div>';</script></head><body><ul>{filler_html(filler)}</ul>"
+        f'<div class="review-list-wrap">{"".join(reviews)}</div>'
+        f"<ul>{filler_html(filler)}</ul></body></html>"
+    )
+
+
+def product_page(filler):
+    rows = "".join(
+        f'<tr><th>{size}</th><td class="goods_size_val">{70 + i}</td><td class="goods_size_val">{45 + i}</td>'
+        f'<td class="goods_size_val">{55 + i}</td><td class="goods_size_val">{60 + i}.5</td></tr>'
+        for i, size in enumerate(["S", "M", "L", "XL"])
+    )
+    return (
+        f"<html><body><ul>{filler_html(filler)}</ul>"
+        '<table id="size_table"><thead><tr><th>cm</th><th class="item_val">총장</th>'
+        '<th class="item_val">어깨너비</th><th class="item_val">가슴단면</th><th class="item_val">소매길이</th></tr>'
+        f'</thead><tbody><tr id="bookmark"><td></td></tr>{rows}</tbody></table>'
+        f"<ul>{filler_html(filler)}</ul></body></html>"
+    ).encode()
+
+
+def extract_reviews(html, parser, parse_only):
+    soup = make_soup(html, parse_only, parser)
+    review_list = soup.find("div", "review-list-wrap").find_all("div", "review-list")
+    return parse_review_list(review_list, ["S", "M", "L"], len(review_list))
+
+
+def extract_sizes(html, parser, parse_only):
+    soup = make_soup(html, parse_only, parser)
+    return to_size_dict_list(soup.find("table", id="size_table"))
+
+
+def throughput(fn, html, parser, parse_only, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(html, parser, parse_only)
+    return repeat / (time.perf_counter() - start)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--reviews", type=int, default=100)
+    arg_parser.add_argument("--filler", type=int, default=2000)
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    pages = {
+        "review list": (extract_reviews, review_list_page(args.reviews, args.filler), REVIEW_LIST_ONLY),
+        "product": (extract_sizes, product_page(args.filler), SIZE_TABLE_ONLY),
+    }
+
+    print(f"{'page':>12} {'parser':>12} {'full':>10} {'strained':>10}")
+    for name, (fn, html, strainer) in pages.items():
+        for parser in PARSERS:
+            full = throughput(fn, html, parser, None, args.repeat)
+            strained = throughput(fn, html, parser, strainer, args.repeat)
+            print(f"{name:>12} {parser:>12} {full:>6.1f}p/s {strained:>6.1f}p/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+리뷰 ranking benchmark: 상품 하나에 합성 리뷰 N개 (기본 10,000개)
+
+python -m benchmarks.bench_ranking [--reviews N] [--top-k K]
+
+- loop: 기존 get_body_shape_difference()처럼 리뷰마다 betas를 풀어 cosine distance 계산 후 sorted()
+- first page: ranking cache miss일 때의 ReviewListView (DB 조회 제외)
+  betas_matrix + cosine_distances로 한 번에 계산 후 next_page로 첫 페이지 K개 선택
+- page: 캐시된 거리 배열에서 cursor 다음 K개 선택 (ReviewListView의 다음 페이지 조회)
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from recommender.betas import pack_betas, unpack_betas
+from recommender.ranking import betas_matrix, cosine_distances, next_page
+
+
+def loop_rank(client_betas, reviews):
+    def difference(review):
+        a = unpack_betas(client_betas).astype(np.float64)
+        b = unpack_betas(review.betas).astype(np.float64)
+        return 1 - np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+
+    return sorted(reviews, key=difference)
+
+
+def first_page(client_betas, reviews, page_size):
+    """
+    ReviewListView.get_distances() + paginate_ranking() on a cache miss, without the queries
+    """
+    ids = np.array([review.id for review in reviews], dtype=np.int64)
+    matrix, valid = betas_matrix([review.betas for review in reviews])
+    distances = cosine_distances(client_betas, matrix, valid)
+    page, _ = next_page(ids, distances, page_size)
+    return ids, distances, page
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reviews", type=int, default=10000)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    reviews = [
+        SimpleNamespace(id=i, betas=pack_betas(betas))
+        for i, betas in enumerate(rng.normal(size=(args.reviews, 10)))
+    ]
+    client_betas = pack_betas(rng.normal(size=10))
+
+    k = args.top_k
+    loop_time, loop_result = best_of(lambda: loop_rank(client_betas, reviews), args.repeat)
+    first_time, (ids, distances, page) = best_of(
+        lambda: first_page(client_betas, reviews, k), args.repeat
+    )
+    after = (distances[page[-1]], ids[page[-1]])
+    page_time, (second_page, _) = best_of(
+        lambda: next_page(ids, distances, k, after), args.repeat
+    )
+
+    assert list(ids[page]) == [r.id for r in loop_result[:k]]
+    assert list(ids[second_page]) == [r.id for r in loop_result[k : 2 * k]]
+
+    print(f"{args.reviews} reviews, page size {k}")
+    print(f"      loop: {loop_time * 1000:8.2f} ms")
+    print(f"first page: {first_time * 1000:8.2f} ms ({loop_time / first_time:.1f}x)")
+    print(f"      page: {page_time * 1000:8.2f} ms (cached distances)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+eager vs TorchScript 네트워크 latency benchmark (conda 환경에서 실행)
+
+python -m recommender.optimized_networks <image> ... [--quantize] 로 export 한 뒤
+python -m benchmarks.bench_runtime <image> [<image> ...] [--optimized-dir DIR] [--repeat 5]
+
+- estimate_mesh와 같은 shape only 경로(estimate_batch(betas_only=True))의 이미지당 latency
+- export한 네트워크별 forward latency
+- 두 runtime의 betas 최대 차이
+"""
+import argparse
+import time
+
+import torch
+
+from recommender.body_shape_estimator import (
+    RUNTIME_EAGER,
+    RUNTIME_TORCHSCRIPT,
+    BodyShapeEstimator,
+)
+from recommender.optimized_networks import (
+    OPTIMIZED_DIR,
+    compare_betas,
+    sample_inputs,
+)
+
+
+def time_per_call(fn, repeat):
+    fn()  # warm up, the first TorchScript calls run the profiling executor
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def network_calls(bse, inputs):
+    """
+    forward of each network on the sample inputs, through the estimator's own interface
+    """
+    return {
+        "yolo": lambda: bse.yolo(*inputs["yolo"]),
+        "pose_estimator": lambda: bse.pose_estimator(*inputs["pose_estimator"]),
+        "ik_net": lambda: bse.ik_net(*inputs["ik_net"]),
+        "feature_extractor": lambda: bse.feature_extractor.extract(*inputs["feature_extractor"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--optimized-dir", default=OPTIMIZED_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    estimators = {
+        RUNTIME_EAGER: BodyShapeEstimator(detection_cache_size=0, runtime=RUNTIME_EAGER),
+        RUNTIME_TORCHSCRIPT: BodyShapeEstimator(
+            detection_cache_size=0,
+            runtime=RUNTIME_TORCHSCRIPT,
+            optimized_dir=args.optimized_dir,
+        ),
+    }
+    if len(estimators[RUNTIME_TORCHSCRIPT].optimized_networks) == 0:
+        raise SystemExit(f"no exported networks in {args.optimized_dir}")
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} threads")
+
+    inputs, _ = sample_inputs(estimators[RUNTIME_EAGER], args.images)
+    pipeline = {}
+    for runtime, bse in estimators.items():
+        with torch.no_grad():
+            for name, fn in network_calls(bse, inputs).items():
+                seconds = time_per_call(fn, args.repeat)
+                print(f"{runtime:>12} {name:>18}: {seconds * 1000:8.1f} ms")
+        pipeline[runtime] = time_per_call(
+            lambda: bse.estimate_batch(args.images, batch_size=args.batch_size, betas_only=True),
+            args.repeat,
+        ) / len(args.images)
+
+    for runtime, seconds in pipeline.items():
+        print(f"{runtime:>12} pipeline: {seconds * 1000:8.1f} ms/image")
+    print(f"speedup: {pipeline[RUNTIME_EAGER] / pipeline[RUNTIME_TORCHSCRIPT]:.2f}x")
+
+    diff = compare_betas(estimators[RUNTIME_EAGER], estimators[RUNTIME_TORCHSCRIPT], args.images)
+    print(f"betas max abs diff: {diff}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+리뷰 페이지 prefetch benchmark: 인위적인 latency를 주는 로컬 fixture 서버에서 parse_reviews 실행
+
+python -m benchmarks.bench_scraper_pipeline [--latency 0.3] [--max-photos 60]
+
+- sequential: 페이지를 받고, 파싱하고, 이미지를 받은 뒤 다음 페이지 요청
+- pipelined: 페이지 N을 처리하는 동안 페이지 N+1을 미리 받음
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# the fixture server is local, measure the pipelining without the per host rate limit
+os.environ.setdefault("SCRAPER_RATE_LIMIT", "0")
+# review images are written to a throwaway spool
+SPOOL_DIR = os.environ["SCRAPER_SPOOL_DIR"] = tempfile.mkdtemp(prefix="bench_spool_")
+
+from scraper import scraper  # noqa: E402
+
+REVIEWS_PER_PAGE = 10
+NUM_PAGES = 30
+
+
+def review_html(base_url, page, i):
+    return (
+        '<div class="review-list">'
+        '<p class="review-profile__body_information">남성 · 175cm · 70kg</p>'
+        '<span class="review-goods-information__option">L</span>'
+        f'<div class="review-contents__text">review {page}-{i}</div>'
+        '<ul class="review-content-photo__list">'
+        f'<li><img src="{base_url}/images/{page}-{i}.jpg"></li>'
+        "</ul></div>"
+    )
+
+
+def make_handler(latency, base_url):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            url = urlparse(self.path)
+            if url.path == "/review/list":
+                page = int(parse_qs(url.query)["page"][0])
+                reviews = ""
+                if page <= NUM_PAGES:
+                    reviews = "".join(
+                        review_html(base_url(), page, i) for i in range(REVIEWS_PER_PAGE)
+                    )
+                body = f'<div class="review-list-wrap">{reviews}</div>'.encode()
+            else:
+                body = b"\xff\xd8\xff" + self.path.encode() + bytes(20000)  # fake jpeg
+
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--max-photos", type=int, default=60)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), None)
+    base_url = lambda: f"http://127.0.0.1:{server.server_address[1]}"
+    server.RequestHandlerClass = make_handler(args.latency, base_url)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scraper.REVIEW_LIST_URL = base_url() + "/review/list"
+
+    try:
+        results = {}
+        for name, prefetch in (("sequential", False), ("pipelined", True)):
+            start = time.perf_counter()
+            reviews = scraper.parse_reviews(0, ["L"], args.max_photos, prefetch=prefetch)
+            results[name] = time.perf_counter() - start
+            assert len(reviews) == args.max_photos
+    finally:
+        shutil.rmtree(SPOOL_DIR)
+        server.shutdown()
+
+    print(f"latency {args.latency}s, {args.max_photos} photos")
+    for name, seconds in results.items():
+        print(f"{name:>10}: {seconds:6.2f}s")
+    print(f"reduction: {1 - results['pipelined'] / results['sequential']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
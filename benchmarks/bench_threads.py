@@ -0,0 +1,101 @@
+"""
+estimate 워커의 프로세스 수 x 프로세스당 스레드 수 sweep (conda 환경에서 실행)
+
+python -m benchmarks.bench_threads <image> [<image> ...] [--configs 1x8 2x4 4x2 8x1] [--pin] [--repeat 4]
+
+- PxT: celery -c P로 띄운 estimate 워커처럼 프로세스 P개가 각각 configure_threads()로 스레드 T개를 사용
+  (T가 0이면 코어 수 / P)
+- 각 프로세스가 모델을 로드하고 warm-up 한 뒤부터, 같은 이미지 집합(images x repeat)을
+  ESTIMATE_BATCH_SIZE 단위 chunk로 나눠 처리할 때까지의 images/sec를 측정 (estimate_mesh와 같은 betas_only 경로)
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+from recommender.worker_threads import available_cpus, configure_threads
+
+BATCH_SIZE = 8
+
+
+def worker(num_processes, process_index, num_threads, pin, chunks, ready, done):
+    configure_threads(num_processes, process_index, num_threads=num_threads, pin_cpus=pin)
+
+    # torch is imported after the thread settings, as in preload_estimator
+    from recommender.body_shape_estimator import BodyShapeEstimator
+
+    bse = BodyShapeEstimator(detection_cache_size=0)
+    bse.warmup()
+    ready.put(process_index)
+
+    n = 0
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        bse.estimate_batch(chunk, batch_size=BATCH_SIZE, betas_only=True)
+        n += len(chunk)
+    done.put(n)
+
+
+def run_config(num_processes, num_threads, pin, img_paths, repeat):
+    ctx = mp.get_context("spawn")  # fresh interpreters, no torch state inherited
+    chunks, ready, done = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=worker,
+            args=(num_processes, i, num_threads, pin, chunks, ready, done),
+        )
+        for i in range(num_processes)
+    ]
+    for proc in procs:
+        proc.start()
+    for _ in procs:
+        ready.get()
+
+    start = time.perf_counter()
+    work = img_paths * repeat
+    for i in range(0, len(work), BATCH_SIZE):
+        chunks.put(work[i : i + BATCH_SIZE])
+    for _ in procs:
+        chunks.put(None)
+    n = sum(done.get() for _ in procs)
+    seconds = time.perf_counter() - start
+
+    for proc in procs:
+        proc.join()
+    return n / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--configs", nargs="+", default=None, help="PxT, e.g. 2x4")
+    parser.add_argument("--pin", action="store_true", help="pin each process to its cores")
+    parser.add_argument("--repeat", type=int, default=4)
+    args = parser.parse_args()
+
+    num_cpus = len(available_cpus())
+    configs = args.configs
+    if configs is None:
+        # every power of two split of the cores
+        configs = []
+        p = 1
+        while p <= num_cpus:
+            configs.append(f"{p}x{num_cpus // p}")
+            p *= 2
+
+    print(f"{num_cpus} cpus, {len(args.images) * args.repeat} images per config, pin={args.pin}")
+    results = {}
+    for config in configs:
+        num_processes, num_threads = (int(v) for v in config.split("x"))
+        results[config] = run_config(
+            num_processes, num_threads, args.pin, args.images, args.repeat
+        )
+        print(f"{config:>6}: {results[config]:8.2f} images/sec")
+
+    best = max(results, key=results.get)
+    print(f"best: {best} (celery -c {best.split('x')[0]}, ESTIMATOR_NUM_THREADS={best.split('x')[1]})")
+
+
+if __name__ == "__main__":
+    main()
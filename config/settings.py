@@ -109,6 +109,46 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# file-based so that the celery workers and the web processes share the ranking cache
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "ranking": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache" / "ranking",
+    },
+    "metrics": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache" / "metrics",
+        "TIMEOUT": None,
+    },
+    "enqueued": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache" / "enqueued",
+    },
+}
+
+METRICS_CACHE = "metrics"  # cache alias of recommender.metrics, shared by the web server and the workers
+
+ESTIMATION_LOCK_CACHE = "enqueued"  # cache alias of the enqueued estimation tasks, shared by the web server processes
+
+RANKING_CACHE = "ranking"  # cache alias of recommender.ranking_cache
+RANKING_LOCAL_CACHE_SIZE = 1024  # in-process LRU entries
+RANKING_CACHE_TIMEOUT = 60 * 60 * 24
+
+# body shape index of every review (recommender.body_shape_index)
+BODY_SHAPE_INDEX_DIR = BASE_DIR / "index" / "body_shape"
+BODY_SHAPE_INDEX_BACKEND = "exact"  # "exact" or "ivf"
+BODY_SHAPE_INDEX_MAX_SEGMENTS = 32  # appended segments merged into a new version past this count
+
+# GoodView serves goods scraped within GOOD_REFRESH_SECONDS from the DB without scraping
+GOOD_REFRESH_SECONDS = 60 * 60 * 24
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,31 @@
+"""
+Client.betas, Review.betas에 저장되는 체형 파라미터(betas) 변환 함수
+betas 10개를 float32 little-endian bytes(40 bytes)로 저장
+"""
+import numpy as np
+
+NUM_BETAS = 10
+BETAS_DTYPE = np.dtype("<f4")
+
+
+def pack_betas(betas):
+    """
+    Input:
+     - betas: python list of float (10,)
+    Output:
+     - bytes (40,)
+    """
+    betas = np.asarray(betas, dtype=BETAS_DTYPE)
+    if betas.shape != (NUM_BETAS,):
+        raise ValueError(f"expected {NUM_BETAS} betas, got shape {betas.shape}")
+    return betas.tobytes()
+
+
+def unpack_betas(blob):
+    """
+    Input:
+     - blob: bytes or memoryview stored in a betas field
+    Output:
+     - np.ndarray of float32 (10,)
+    """
+    return np.frombuffer(blob, dtype=BETAS_DTYPE, count=NUM_BETAS)
@@ -9,6 +9,9 @@ os.environ[
     "PYOPENGL_PLATFORM"
 ] = "osmesa"  # set osmesa as render backend for use in SSH
 
+import hashlib
+from collections import Counter, OrderedDict
+
 import torch
 
 import cv2
@@ -17,6 +20,7 @@ import argparse
 
 from YOLOv4.tool.utils import load_class_names
 from YOLOv4.tool.torch_utils import do_detect
+from lib.utils import img_utils
 from lib.utils.img_utils import split_boxes_cv2
 from lib.utils.model_utils import create_all_network
 from lib.utils.input_utils import (
@@ -34,13 +38,328 @@ from lib.utils.output_utils import (
     save_mesh_rendering,
     save_mesh_pkl,
 )
+from recommender.optimized_networks import OPTIMIZED_DIR, load_optimized_networks
+
+
+# pre-filter of the primary person box, images failing it skip every stage after detection
+# box height / image height below this: person too small (flat-lay, background person)
+PREFILTER_MIN_HEIGHT = float(os.getenv("PREFILTER_MIN_HEIGHT", "0.35"))
+# box height / box width in pixels below this: not a standing full body (close-up, torso, sitting)
+PREFILTER_MIN_ASPECT = float(os.getenv("PREFILTER_MIN_ASPECT", "1.6"))
+# box bottom within this margin of the image bottom: legs cut off by the frame
+PREFILTER_EDGE_MARGIN = float(os.getenv("PREFILTER_EDGE_MARGIN", "0.005"))
+
+# longer side of the working image in pixels, larger photos are decoded at reduced resolution and downscaled
+# detection boxes are normalized so every stage after decoding only sees the capped image, 0 disables the cap
+MAX_IMAGE_SIDE = int(os.getenv("ESTIMATOR_MAX_IMAGE_SIDE", "1280"))
+
+# networks used for inference: "eager" (create_all_network) or "torchscript" (exported by
+# python -m recommender.optimized_networks into ESTIMATOR_OPTIMIZED_DIR, eager for the networks not exported)
+RUNTIME_EAGER = "eager"
+RUNTIME_TORCHSCRIPT = "torchscript"
+ESTIMATOR_RUNTIME = os.getenv("ESTIMATOR_RUNTIME", RUNTIME_EAGER)
+
+# rejection reasons
+REJECT_DECODE_FAILED = "decode_failed"
+REJECT_NO_PERSON = "no_person"
+REJECT_SMALL_PERSON = "small_person"
+REJECT_NOT_FULL_BODY = "not_full_body"
+REJECT_CROPPED_BODY = "cropped_body"
+
+
+class DetectionCache:
+    """
+    LRU cache of YOLO detection boxes keyed by the content hash of the image file
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._boxes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self._boxes:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._boxes.move_to_end(key)
+        return self._boxes[key]
+
+    def put(self, key, boxes):
+        self._boxes[key] = boxes
+        self._boxes.move_to_end(key)
+        while len(self._boxes) > self.max_entries:
+            self._boxes.popitem(last=False)
+
+
+class RendererPool:
+    """
+    Reusable osmesa Renderers keyed by resolution, at most max_renderers are kept alive
+    """
+
+    def __init__(self, smpl, max_renderers=4):
+        self.smpl = smpl
+        self.max_renderers = max_renderers
+        self._renderers = OrderedDict()
+
+    def get(self, resolution):
+        """
+        Input:
+         - resolution: (width, height) of the image to render on
+        Output:
+         - Renderer of the given resolution
+        """
+        if resolution in self._renderers:
+            self._renderers.move_to_end(resolution)
+            return self._renderers[resolution]
 
+        renderer = Renderer(smpl=self.smpl, resolution=resolution, orig_img=True)
+        self._renderers[resolution] = renderer
+        while len(self._renderers) > self.max_renderers:
+            self._renderers.popitem(last=False)
+        return renderer
+
+
+class ImageBuffers:
+    """
+    Preallocated uint8 arrays reused across the images of a worker, one per key.
+    An array is reallocated only when a request does not fit in it, so a worker estimating photos
+    of a few capped sizes stops allocating after the first chunks.
+    """
 
-class BodyShapeEstimator:
     def __init__(self):
+        self._arrays = {}
+
+    def get(self, key, shape):
+        """
+        Input:
+         - key: owner of the array, e.g. ("ingest", slot)
+         - shape: requested shape
+        Output:
+         - contiguous uint8 array of the given shape, a view of the preallocated array
+           (valid until the next get() with the same key)
+        """
+        arr = self._arrays.get(key)
+        if arr is None or arr.shape[1:] != tuple(shape[1:]) or arr.shape[0] < shape[0]:
+            arr = np.empty(shape, dtype=np.uint8)
+            self._arrays[key] = arr
+        return arr[: shape[0]]
+
+
+# JPEG start of frame markers (SOF0 - SOF15 except DHT, JPG and DAC)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def jpeg_size(content):
+    """
+    Input:
+     - content: file content
+    Output:
+     - (width, height) read from the JPEG frame header, None if content is not a JPEG
+    """
+    if content[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(content):
+        if content[pos] != 0xFF:
+            return None
+        marker = content[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # fill byte
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            pos += 2  # markers without a length
+            continue
+        length = int.from_bytes(content[pos + 2 : pos + 4], "big")
+        if marker in SOF_MARKERS:
+            if pos + 9 > len(content):
+                return None
+            height = int.from_bytes(content[pos + 5 : pos + 7], "big")
+            width = int.from_bytes(content[pos + 7 : pos + 9], "big")
+            return width, height
+        if marker == 0xDA:
+            return None  # scan data started without a frame header
+        pos += 2 + length
+    return None
+
+
+def decode_flag(content, max_side):
+    """
+    IMREAD_REDUCED_COLOR_* flag for a JPEG whose longer side stays >= max_side after the reduction,
+    IMREAD_COLOR if the image is not a JPEG or already small enough
+    """
+    size = jpeg_size(content) if max_side > 0 else None
+    if size is None:
+        return cv2.IMREAD_COLOR
+    for scale, flag in REDUCED_DECODE_FLAGS:
+        if max(size) // scale >= max_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def read_image(imgfile, max_side=MAX_IMAGE_SIDE, buffers=None, key=None):
+    """
+    Ingest stage: decode an image at the working resolution.
+    JPEGs are decoded by libjpeg at 1/2, 1/4 or 1/8 scale when that still covers max_side,
+    then downscaled so the longer side is at most max_side.
+
+    Input:
+     - imgfile: image path
+     - max_side: longer side of the returned image (0: keep the original resolution)
+     - buffers, key: ImageBuffers and key to downscale into (Optional: if None, a new array is allocated)
+    Output:
+     - orig_img: BGR image (H, W, 3), None if the file cannot be decoded
+     - content_hash: sha1 hex digest of the file content
+    """
+    with open(imgfile, "rb") as f:
+        content = f.read()
+    content_hash = hashlib.sha1(content).hexdigest()
+    orig_img = cv2.imdecode(
+        np.frombuffer(content, dtype=np.uint8), decode_flag(content, max_side)
+    )
+    if orig_img is None or max_side <= 0:
+        return orig_img, content_hash
+
+    height, width = orig_img.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return orig_img, content_hash
+
+    # a reduced JPEG decode leaves less than 2x to downscale, where bilinear does not alias
+    # and is several times faster than INTER_AREA
+    interpolation = cv2.INTER_LINEAR if scale > 0.5 else cv2.INTER_AREA
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if buffers is None:
+        return cv2.resize(orig_img, size, interpolation=interpolation), content_hash
+    dst = buffers.get(key, (size[1], size[0], 3))
+    cv2.resize(orig_img, size, dst=dst, interpolation=interpolation)
+    return dst, content_hash
+
+
+class InMemoryCV2:
+    """
+    cv2 as seen by split_boxes_cv2 inside split_person_patches(): imwrite does nothing, the rest is cv2
+    """
+
+    def __getattr__(self, name):
+        return getattr(cv2, name)
+
+    @staticmethod
+    def imwrite(filename, img, params=None):
+        return True
+
+
+def split_person_patches(orig_img, boxes, class_names):
+    """
+    split_boxes_cv2 with its patch writes dropped: the library crop (same geometry and refined boxes as
+    the original mesh pipeline) with the patches kept in memory, nothing is written to disk.
+
+    Input:
+     - orig_img: BGR image (H, W, 3)
+     - boxes: YOLO boxes of the image [x1, y1, x2, y2, conf, conf, class id], normalized to [0, 1]
+     - class_names: YOLO class names
+    Output:
+     - img_patch_list, refined_boxes, trans_invs: as returned by split_boxes_cv2
+    """
+    # model processes are single threaded (celery prefork), the module is restored right after
+    library_cv2 = img_utils.cv2
+    img_utils.cv2 = InMemoryCV2()
+    try:
+        return split_boxes_cv2(orig_img, boxes, os.devnull, class_names)
+    finally:
+        img_utils.cv2 = library_cv2
+
+
+def select_primary_person(boxes, class_names):
+    """
+    Pick the subject of a review / client photo among the detected persons, before any heavy stage runs.
+    score = confidence * box area * (1 - 0.5 * distance of the box center from the image center)
+    so a large, central, confident person wins over bystanders and people in the background.
+
+    Input:
+     - boxes: YOLO boxes of the image [x1, y1, x2, y2, conf, conf, class id], normalized to [0, 1]
+     - class_names: YOLO class names
+    Output:
+     - YOLO box of the primary person, None if no person was detected
+    """
+    best_box = None
+    best_score = 0.0
+    for box in boxes:
+        if class_names[int(box[6])] != "person":
+            continue
+
+        x1, y1, x2, y2 = np.clip(np.asarray(box[:4], dtype=np.float64), 0.0, 1.0)
+        area = (x2 - x1) * (y2 - y1)
+        if area <= 0:
+            continue
+
+        # distance of the box center from the image center, 1 at a corner
+        offcenter = np.hypot((x1 + x2) / 2 - 0.5, (y1 + y2) / 2 - 0.5) / np.hypot(0.5, 0.5)
+        score = float(box[4]) * area * (1 - 0.5 * offcenter)
+        if score > best_score:
+            best_box = box
+            best_score = score
+
+    return best_box
+
+
+def prefilter_reason(box, orig_width, orig_height, prefilter=True):
+    """
+    Cheap checks on the primary person box, run before any network after YOLO.
+    The thresholds are tuned for review photos.
+
+    Input:
+     - box: YOLO box of the primary person (select_primary_person), None if no person
+     - orig_width, orig_height: image size in pixels
+     - prefilter: if False, only images without a person are rejected (client photos)
+    Output:
+     - rejection reason, None if the image is usable
+    """
+    if box is None:
+        return REJECT_NO_PERSON
+    if not prefilter:
+        return None
+
+    x1, y1, x2, y2 = np.clip(np.asarray(box[:4], dtype=np.float64), 0.0, 1.0)
+    if y2 - y1 < PREFILTER_MIN_HEIGHT:
+        return REJECT_SMALL_PERSON
+
+    aspect = (y2 - y1) * orig_height / max((x2 - x1) * orig_width, 1e-6)
+    if aspect < PREFILTER_MIN_ASPECT:
+        return REJECT_NOT_FULL_BODY
+
+    if y2 >= 1 - PREFILTER_EDGE_MARGIN:
+        return REJECT_CROPPED_BODY
+
+    return None
+
+
+class BodyShapeEstimator:
+    def __init__(
+        self,
+        detection_cache_size=512,
+        max_renderers=4,
+        runtime=ESTIMATOR_RUNTIME,
+        optimized_dir=OPTIMIZED_DIR,
+    ):
         """
         load MultiPerson model
+
+        Input:
+         - detection_cache_size: number of images whose detection boxes are cached (0: no cache)
+         - max_renderers: number of Renderers (one per image resolution) kept for reuse
+         - runtime: RUNTIME_EAGER or RUNTIME_TORCHSCRIPT
+         - optimized_dir: exported networks loaded by the torchscript runtime
         """
+        if runtime not in (RUNTIME_EAGER, RUNTIME_TORCHSCRIPT):
+            raise ValueError(f"unknown estimator runtime: {runtime}")
+
         config_path = "/home/myungjune/projects/multiperson/configs/demo.yaml"
 
         self.demo_cfg = update_config(config_path)
@@ -48,6 +367,10 @@ class BodyShapeEstimator:
         self.height = self.demo_cfg.YOLO.target_height
         self.width = self.demo_cfg.YOLO.target_width
         self.n_classes = self.demo_cfg.YOLO.n_classes
+        self.class_names = load_class_names(self.namesfile)
+        self.detection_cache = (
+            DetectionCache(detection_cache_size) if detection_cache_size > 0 else None
+        )
 
         self.FLAGS = self.demo_cfg.PoseEstimator.FLAGS
         self.max_num_person = self.demo_cfg.SmplTR.max_num_person
@@ -60,107 +383,335 @@ class BodyShapeEstimator:
             self.smpl_layer,
             self.smplTR,
         ) = create_all_network(self.demo_cfg)
+        # smpl_layer and smplTR always stay eager
+        self.optimized_networks = []
+        if runtime == RUNTIME_TORCHSCRIPT:
+            self.optimized_networks = load_optimized_networks(self, optimized_dir)
+        self.renderer_pool = RendererPool(self.smpl_layer, max_renderers)
+        # decoded images and YOLO inputs of a chunk are written into the same arrays chunk after chunk
+        self.buffers = ImageBuffers()
+
+        # rejection reason of each image of the last estimate_batch() call (None: estimated), and counts since load
+        self.rejection_reasons = []
+        self.rejection_counts = Counter()
 
         print("init success")
 
-    def estimate(self, imgfile, betas_only=False):
+    def warmup(self):
+        """
+        run a dummy detection so that the first real request does not pay for lazy initialization
+        """
+        dummy_img = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        with torch.no_grad():
+            do_detect(self.yolo, dummy_img, 0.4, 0.6, use_cuda=False)
+
+    def detect(self, orig_img, content_hash=None):
+        """
+        Input:
+         - orig_img: BGR image (H, W, 3)
+         - content_hash: key of the detection cache (Optional: if None, the cache is not used)
+        Output:
+         - boxes: YOLO boxes of the image, normalized to [0, 1]
+        """
+        return self.detect_batch([orig_img], [content_hash])[0]
+
+    def detect_batch(self, orig_imgs, content_hashes):
+        """
+        Run YOLO once on the stacked images whose boxes are not cached.
+
+        Input:
+         - orig_imgs: list of BGR images
+         - content_hashes: list of detection cache keys (None: do not use the cache for that image)
+        Output:
+         - boxes_list: list of YOLO boxes, aligned with orig_imgs
+        """
+        boxes_list = [None] * len(orig_imgs)
+        miss_indices = []
+        for i, content_hash in enumerate(content_hashes):
+            if self.detection_cache is not None and content_hash is not None:
+                boxes_list[i] = self.detection_cache.get(content_hash)
+            if boxes_list[i] is None:
+                miss_indices.append(i)
+
+        if len(miss_indices) == 0:
+            return boxes_list
+
+        # resized and converted in place in the preallocated YOLO input batch
+        yolo_input_imgs = self.buffers.get(
+            "yolo", (len(miss_indices), self.height, self.width, 3)
+        )
+        for n, i in enumerate(miss_indices):
+            cv2.resize(orig_imgs[i], (self.width, self.height), dst=yolo_input_imgs[n])
+            cv2.cvtColor(yolo_input_imgs[n], cv2.COLOR_BGR2RGB, dst=yolo_input_imgs[n])
+
+        with torch.no_grad():
+            detected = do_detect(self.yolo, yolo_input_imgs, 0.4, 0.6, use_cuda=False)
+
+        for i, boxes in zip(miss_indices, detected):
+            boxes_list[i] = boxes
+            if self.detection_cache is not None and content_hashes[i] is not None:
+                self.detection_cache.put(content_hashes[i], boxes)
+
+        return boxes_list
+
+    def estimate(self, imgfile, betas_only=False, prefilter=True):
         """
         Input:
          - image: image path
+         - betas_only: use the shape only pipeline
+         - prefilter: reject photos that are not full body shots (prefilter_reason), for review photos
         Output:
          - betas: python list of float body shape parameters (10,)
          - meshed_image: path to mesh of given image (Optional: if betas_only is True, return None)
         """
+        return self.estimate_batch(
+            [imgfile], batch_size=1, betas_only=betas_only, prefilter=prefilter
+        )[0]
 
-        split_images_folder, pose_results_folder, mesh_results_folder = make_folder(
-            self.demo_cfg, imgfile
-        )
+    def estimate_betas_batch(self, imgfiles, prefilter=True):
+        """
+        Shape only pipeline: detection -> primary person -> pose estimator -> IK net.
+        No folder is created, no joints or patches are dumped and no renderer is built.
 
-        orig_img = cv2.imread(imgfile)
-        orig_height, orig_width = orig_img.shape[:2]
-        renderer = Renderer(
-            smpl=self.smpl_layer, resolution=(orig_width, orig_height), orig_img=True
+        Input:
+         - imgfiles: list of image paths
+         - prefilter: see estimate()
+        Output:
+         - list of {"betas": (10,), "meshed_image": None} aligned with imgfiles (None if person not found)
+        """
+        results = [None] * len(imgfiles)
+        reasons = [None] * len(imgfiles)
+        self.rejection_reasons = reasons
+
+        images = []  # (index in imgfiles, orig_img, content_hash)
+        for idx, imgfile in enumerate(imgfiles):
+            orig_img, content_hash = read_image(
+                imgfile, buffers=self.buffers, key=("ingest", idx)
+            )
+            if orig_img is None:
+                print(f"failed to decode image {imgfile}")
+                reasons[idx] = REJECT_DECODE_FAILED
+                continue
+            images.append((idx, orig_img, content_hash))
+
+        if len(images) == 0:
+            return results
+
+        boxes_list = self.detect_batch(
+            [orig_img for _, orig_img, _ in images],
+            [content_hash for _, _, content_hash in images],
         )
 
-        yolo_input_img = cv2.resize(orig_img, (self.width, self.height))
-        yolo_input_img = cv2.cvtColor(yolo_input_img, cv2.COLOR_BGR2RGB)
+        indices = []
+        patches = []
+        for (idx, orig_img, _), boxes in zip(images, boxes_list):
+            # only the primary person is cropped and passed to the networks
+            primary_box = select_primary_person(boxes, self.class_names)
+            orig_height, orig_width = orig_img.shape[:2]
+            reasons[idx] = prefilter_reason(primary_box, orig_width, orig_height, prefilter)
+            if reasons[idx] is not None:
+                continue
+
+            img_patch_list, _, _ = split_person_patches(
+                orig_img, [primary_box], self.class_names
+            )
+            if len(img_patch_list) < 1:
+                reasons[idx] = REJECT_NO_PERSON  # degenerate box
+                continue
+            indices.append(idx)
+            patches.append(img_patch_list[0])
+
+        if len(patches) == 0:
+            return results
+
+        with torch.no_grad():
+            pe_inputs = [get_pose_estimator_input(p, self.FLAGS) for p in patches]
+            img_pe_input = torch.cat([img_pe_input for _, img_pe_input, _ in pe_inputs])
+            intrinsic = torch.cat([intrinsic for _, _, intrinsic in pe_inputs])
+            j2d, j3d, j3d_abs, skeleton_indices, edges = self.pose_estimator(
+                img_pe_input, intrinsic, intrinsic
+            )
 
-        for i in range(2):
-            boxes = do_detect(self.yolo, yolo_input_img, 0.4, 0.6, use_cuda=False)
+            img_ik_input = torch.cat(
+                [get_ik_input(p, self.demo_cfg, self.FLAGS) for p in patches]
+            )
+            betas_ik_net = self.ik_net(img_ik_input, j3d_abs / 1000).pred_shape
 
-        class_names = load_class_names(self.namesfile)
-        img_patch_list, refined_boxes, trans_invs = split_boxes_cv2(
-            orig_img, boxes[0], split_images_folder, class_names
-        )
-        refined_boxes = np.array(refined_boxes)
+        for n, idx in enumerate(indices):
+            results[idx] = {"betas": betas_ik_net[n].tolist(), "meshed_image": None}
 
-        num_person = len(img_patch_list)
-        num_person = min(num_person, self.max_num_person)
-        if num_person < 1: 
-            return None # person not found
+        return results
 
-        feature_dump = torch.zeros(1, self.max_num_person, 2048).float()
-        rot6d_dump = torch.zeros(1, self.max_num_person, 24, 6).float()
-        betas_dump = torch.zeros(1, self.max_num_person, 10).float()
+    def estimate_batch(self, imgfiles, batch_size=8, betas_only=False, prefilter=True):
+        """
+        Estimate several images, stacking the inputs of every network into batched forward passes.
 
-        for person_id, img_patch in enumerate(img_patch_list[:num_person]):
-            img_plot, img_pe_input, intrinsic = get_pose_estimator_input(
-                img_patch, self.FLAGS
+        Input:
+         - imgfiles: list of image paths
+         - batch_size: number of images processed together
+         - betas_only: use the shape only pipeline (estimate_betas_batch)
+         - prefilter: see estimate()
+        Output:
+         - list of estimate() results aligned with imgfiles (None if person not found)
+           the reason of every None is in self.rejection_reasons
+        """
+        results = []
+        reasons = []
+        for start in range(0, len(imgfiles), batch_size):
+            chunk = imgfiles[start : start + batch_size]
+            if betas_only:
+                results += self.estimate_betas_batch(chunk, prefilter)
+            else:
+                results += self._estimate_chunk(chunk, prefilter)
+            reasons += self.rejection_reasons
+
+        self.rejection_reasons = reasons
+        self.rejection_counts.update(reason for reason in reasons if reason is not None)
+        return results
+
+    def _estimate_chunk(self, imgfiles, prefilter=True):
+        results = [None] * len(imgfiles)
+        reasons = [None] * len(imgfiles)
+        self.rejection_reasons = reasons
+
+        images = []  # (index in imgfiles, imgfile, orig_img, content_hash)
+        for idx, imgfile in enumerate(imgfiles):
+            orig_img, content_hash = read_image(
+                imgfile, buffers=self.buffers, key=("ingest", idx)
             )
+            if orig_img is None:
+                print(f"failed to decode image {imgfile}")
+                reasons[idx] = REJECT_DECODE_FAILED
+                continue
+            images.append((idx, imgfile, orig_img, content_hash))
+
+        if len(images) == 0:
+            return results
+
+        boxes_list = self.detect_batch(
+            [orig_img for _, _, orig_img, _ in images],
+            [content_hash for _, _, _, content_hash in images],
+        )
 
-            with torch.no_grad():
-                j2d, j3d, j3d_abs, skeleton_indices, edges = self.pose_estimator(
-                    img_pe_input, intrinsic, intrinsic
-                )
+        # the primary person patch of every image, flattened over the whole chunk
+        # bystanders are dropped here so pose / IK / feature extraction / SmplTR / rendering skip them
+        # split_person_patches keeps the patches in memory (split_boxes_cv2 without its writes),
+        # the folders only receive the pose and mesh results
+        splits = {}  # index in images -> folders, refined box of the primary person in the image
+        persons = []  # (index in images, person_id) of each patch
+        patches = []
+        for i, ((idx, imgfile, orig_img, _), boxes) in enumerate(zip(images, boxes_list)):
+            # rejected images never get folders, patches or renderers
+            primary_box = select_primary_person(boxes, self.class_names)
+            orig_height, orig_width = orig_img.shape[:2]
+            reasons[idx] = prefilter_reason(primary_box, orig_width, orig_height, prefilter)
+            if reasons[idx] is not None:
+                continue
+
+            # the library crop, the meshes are placed with the refined boxes of split_boxes_cv2
+            img_patch_list, refined_boxes, _ = split_person_patches(
+                orig_img, [primary_box], self.class_names
+            )
 
-            save_3d_joints(j3d_abs, edges, pose_results_folder, person_id)
-            save_2d_joints(img_plot, j2d, edges, pose_results_folder, person_id)
+            num_person = len(img_patch_list)
+            num_person = min(num_person, self.max_num_person)
+            if num_person < 1:
+                reasons[idx] = REJECT_NO_PERSON  # degenerate box
+                continue
+
+            splits[i] = {
+                "folders": make_folder(self.demo_cfg, imgfile),
+                "refined_boxes": np.array(refined_boxes),
+                "num_person": num_person,
+            }
+            for person_id in range(num_person):
+                persons.append((i, person_id))
+                patches.append(img_patch_list[person_id])
+
+        if len(patches) == 0:
+            return results
+
+        with torch.no_grad():
+            pe_inputs = [get_pose_estimator_input(p, self.FLAGS) for p in patches]
+            img_pe_input = torch.cat([img_pe_input for _, img_pe_input, _ in pe_inputs])
+            intrinsic = torch.cat([intrinsic for _, _, intrinsic in pe_inputs])
+            j2d, j3d, j3d_abs, skeleton_indices, edges = self.pose_estimator(
+                img_pe_input, intrinsic, intrinsic
+            )
+
+            for n, (i, person_id) in enumerate(persons):
+                pose_results_folder = splits[i]["folders"][1]
+                img_plot = pe_inputs[n][0]
+                save_3d_joints(j3d_abs[n : n + 1], edges, pose_results_folder, person_id)
+                save_2d_joints(
+                    img_plot, j2d[n : n + 1], edges, pose_results_folder, person_id
+                )
 
-            img_ik_input = get_ik_input(img_patch, self.demo_cfg, self.FLAGS)
+            img_ik_input = torch.cat(
+                [get_ik_input(p, self.demo_cfg, self.FLAGS) for p in patches]
+            )
             j3ds_abs_meter = j3d_abs / 1000
             ik_net_output = self.ik_net(img_ik_input, j3ds_abs_meter)
             rot6d_ik_net = ik_net_output.pred_rot6d
-
             betas_ik_net = ik_net_output.pred_shape
-            if betas_only:
-                # os.chdir(old_cwd)
-                return {"betas": betas_ik_net[0].tolist(), "meshed_image": None}
 
-            img_fe_input = get_feature_extractor_input(img_patch)
+        # one SmplTR sample per image with at least one person
+        image_ids = sorted(splits)
+        slot = {i: b for b, i in enumerate(image_ids)}
+        feature_dump = torch.zeros(len(image_ids), self.max_num_person, 2048).float()
+        rot6d_dump = torch.zeros(len(image_ids), self.max_num_person, 24, 6).float()
+        betas_dump = torch.zeros(len(image_ids), self.max_num_person, 10).float()
+
+        with torch.no_grad():
+            img_fe_input = torch.cat([get_feature_extractor_input(p) for p in patches])
             img_feature = self.feature_extractor.extract(img_fe_input)
 
-            feature_dump[0][person_id] = img_feature[0]
-            rot6d_dump[0][person_id] = rot6d_ik_net[0]
-            betas_dump[0][person_id] = betas_ik_net[0]
+            for n, (i, person_id) in enumerate(persons):
+                feature_dump[slot[i]][person_id] = img_feature[n]
+                rot6d_dump[slot[i]][person_id] = rot6d_ik_net[n]
+                betas_dump[slot[i]][person_id] = betas_ik_net[n]
+
+            refined_rot6d, refined_betas, refined_cam = self.smplTR(
+                feature_dump, rot6d_dump, betas_dump
+            )
 
         angle = 6.5
         axis = "x"
-        refined_rot6d, refined_betas, refined_cam = self.smplTR(
-            feature_dump, rot6d_dump, betas_dump
-        )
-        axis_angle, rot6d, betas, cam, verts, faces = process_output(
-            self.smpl_layer,
-            refined_rot6d,
-            refined_betas,
-            refined_cam,
-            rotation_angle=angle,
-            rotation_axis=axis,
-        )
+        for i in image_ids:
+            b = slot[i]
+            idx, _, orig_img, _ = images[i]
+            axis_angle, rot6d, betas, cam, verts, faces = process_output(
+                self.smpl_layer,
+                refined_rot6d[b : b + 1],
+                refined_betas[b : b + 1],
+                refined_cam[b : b + 1],
+                rotation_angle=angle,
+                rotation_axis=axis,
+            )
 
-        meshed_image_name = save_mesh_rendering(
-            renderer,
-            verts,
-            refined_boxes,
-            cam,
-            orig_height,
-            orig_width,
-            num_person,
-            mesh_results_folder,
-            rotation_angle=angle,
-            rotation_axis=axis,
-        )
+            orig_height, orig_width = orig_img.shape[:2]
+            renderer = self.renderer_pool.get((orig_width, orig_height))
+            meshed_image_name = save_mesh_rendering(
+                renderer,
+                verts,
+                splits[i]["refined_boxes"],
+                cam,
+                orig_height,
+                orig_width,
+                splits[i]["num_person"],
+                splits[i]["folders"][2],
+                rotation_angle=angle,
+                rotation_axis=axis,
+            )
+
+            # IK net betas of the primary person (person_id 0), the same kind estimate_betas_batch returns:
+            # betas of both pipelines are ranked together, the SmplTR refined betas only shape the mesh
+            results[idx] = {
+                "betas": betas_dump[b][0].tolist(),
+                "meshed_image": meshed_image_name,
+            }
 
-        return {"betas": betas_ik_net[0].tolist(), "meshed_image": meshed_image_name}
+        return results
 
     def extract_betas(self, image):
         """
@@ -0,0 +1,417 @@
+"""
+전체 리뷰에 대한 체형(betas) 벡터 인덱스. "나와 비슷한 체형의 리뷰어" 검색용
+
+- 정규화된 betas를 저장하므로 cosine distance = 1 - dot
+- backend "exact": brute-force, "ivf": k-means로 나눈 inverted list 중 가까운 n_probe개만 검색
+- 디스크에 .npy로 저장하고 memory-mapped로 로드
+- 새 리뷰는 현재 버전에 segment(.npz)로 덧붙이고, segment가 많아지면 새 버전으로 합침
+- 성별, 키 범위, 상품으로 필터링
+"""
+import fcntl
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from recommender.betas import BETAS_DTYPE, NUM_BETAS
+
+GENDER_CODES = {"M": 0, "F": 1}
+ARRAYS = ("vectors", "ids", "genders", "heights", "goods", "assignments")
+SEGMENTS_DIR = "segments"
+
+
+def normalize(betas):
+    betas = np.atleast_2d(np.asarray(betas, dtype=np.float32))
+    norms = np.linalg.norm(betas, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return betas / norms
+
+
+def kmeans(vectors, n_lists, n_iter=20, seed=0):
+    """
+    Lloyd k-means over normalized vectors (spherical: centroids are re-normalized)
+
+    Output:
+     - centroids: (n_lists, 10)
+     - assignments: (n,) centroid index of each vector
+    """
+    rng = np.random.default_rng(seed)
+    n_lists = min(n_lists, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.stack(
+            [
+                np.bincount(assignments, weights=vectors[:, d], minlength=n_lists)
+                for d in range(vectors.shape[1])
+            ],
+            axis=1,
+        )
+        counts = np.bincount(assignments, minlength=n_lists)
+        # empty lists keep their previous centroid
+        centroids[counts > 0] = sums[counts > 0]
+        centroids = normalize(centroids)
+    assignments = np.argmax(vectors @ centroids.T, axis=1)
+    return centroids, assignments
+
+
+class BodyShapeIndex:
+    def __init__(self, backend="exact", n_probe=8):
+        if backend not in ("exact", "ivf"):
+            raise ValueError(f"unknown index backend {backend}")
+        self.backend = backend
+        self.n_probe = n_probe
+
+        self.vectors = np.empty((0, NUM_BETAS), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.genders = np.empty(0, dtype=np.uint8)
+        self.heights = np.empty(0, dtype=np.float32)
+        self.goods = np.empty(0, dtype=np.int64)
+
+        # ivf: rows [0, n_sorted) are grouped by centroid, list c is rows [offsets[c], offsets[c + 1])
+        # rows added after the last build form an unsorted tail that is always scanned
+        self.centroids = np.empty((0, NUM_BETAS), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.n_sorted = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids, betas, genders, heights, goods, backend="exact", n_lists=None):
+        """
+        Input:
+         - ids: review ids
+         - betas: (n, 10) betas of the reviews
+         - genders: "M" or "F" of the reviews
+         - heights, goods: height and good id of the reviews
+         - n_lists: number of ivf lists (Optional: if None, about sqrt(n))
+        """
+        index = cls(backend)
+        index.ids = np.asarray(ids, dtype=np.int64)
+        index.vectors = normalize(betas) if len(index.ids) else index.vectors
+        index.genders = np.array([GENDER_CODES[g] for g in genders], dtype=np.uint8)
+        index.heights = np.asarray(heights, dtype=np.float32)
+        index.goods = np.asarray(goods, dtype=np.int64)
+        index.assignments = np.zeros(len(index.ids), dtype=np.int64)
+
+        if backend == "ivf" and len(index) > 0:
+            n_lists = n_lists or max(1, int(np.sqrt(len(index))))
+            centroids, assignments = kmeans(index.vectors, n_lists)
+            order = np.argsort(assignments, kind="stable")
+            for name in ("vectors", "ids", "genders", "heights", "goods"):
+                setattr(index, name, getattr(index, name)[order])
+            index.centroids = centroids
+            index.assignments = assignments[order]
+            index.offsets = np.searchsorted(
+                index.assignments, np.arange(len(centroids) + 1)
+            ).astype(np.int64)
+            index.n_sorted = len(index)
+
+        return index
+
+    def _materialize(self):
+        # memory-mapped arrays are read-only, copy them before modifying
+        for name in ARRAYS:
+            array = getattr(self, name)
+            if isinstance(array, np.memmap):
+                setattr(self, name, np.array(array))
+
+    def add(self, ids, betas, genders, heights, goods):
+        """
+        Add reviews to the index. Reviews already in the index are replaced.
+        """
+        self._materialize()
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = normalize(betas)
+        genders = np.array([GENDER_CODES[g] for g in genders], dtype=np.uint8)
+        heights = np.asarray(heights, dtype=np.float32)
+        goods = np.asarray(goods, dtype=np.int64)
+        if len(self.centroids) > 0:
+            assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+        else:
+            assignments = np.zeros(len(ids), dtype=np.int64)
+
+        # an updated vector may belong to another ivf list, re-add it to the unsorted tail
+        existing = np.isin(ids, self.ids)
+        if existing.any():
+            self.remove(ids[existing])
+
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.ids = np.concatenate([self.ids, ids])
+        self.genders = np.concatenate([self.genders, genders])
+        self.heights = np.concatenate([self.heights, heights])
+        self.goods = np.concatenate([self.goods, goods])
+        self.assignments = np.concatenate([self.assignments, assignments])
+
+    def remove(self, ids):
+        """
+        Remove reviews from the index
+        """
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64))
+        if keep.all():
+            return
+
+        if self.n_sorted > 0:
+            # keep the ivf lists contiguous: recompute offsets over the kept sorted rows
+            sorted_assignments = np.asarray(self.assignments[: self.n_sorted])
+            sorted_assignments = sorted_assignments[keep[: self.n_sorted]]
+            self.n_sorted = len(sorted_assignments)
+            self.offsets = np.searchsorted(
+                sorted_assignments, np.arange(len(self.centroids) + 1)
+            ).astype(np.int64)
+
+        for name in ARRAYS:
+            setattr(self, name, np.asarray(getattr(self, name))[keep])
+
+    def _candidates(self, query):
+        if self.backend == "exact" or len(self.centroids) == 0:
+            return np.arange(len(self))
+
+        probes = np.argsort(self.centroids @ query)[::-1][: self.n_probe]
+        ranges = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes]
+        ranges.append(np.arange(self.n_sorted, len(self)))  # unsorted tail
+        return np.concatenate(ranges)
+
+    def search(
+        self, betas, k=20, gender=None, min_height=None, max_height=None, good_id=None
+    ):
+        """
+        Input:
+         - betas: (10,) betas of the query body shape
+         - k: number of nearest reviews
+         - gender, min_height, max_height, good_id: filters (Optional)
+        Output:
+         - ids: review ids of the k nearest reviews, ascending distance
+         - distances: cosine distances of them
+        """
+        query = normalize(betas)[0]
+        candidates = self._candidates(query)
+
+        mask = np.ones(len(candidates), dtype=bool)
+        if gender is not None:
+            mask &= self.genders[candidates] == GENDER_CODES[gender]
+        if min_height is not None:
+            mask &= self.heights[candidates] >= min_height
+        if max_height is not None:
+            mask &= self.heights[candidates] <= max_height
+        if good_id is not None:
+            mask &= self.goods[candidates] == good_id
+        candidates = candidates[mask]
+
+        distances = 1 - self.vectors[candidates] @ query
+        if len(candidates) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+            candidates, distances = candidates[top], distances[top]
+
+        order = np.argsort(distances, kind="stable")
+        return self.ids[candidates[order]], distances[order]
+
+    def save(self, path, keep_versions=2):
+        """
+        Write a new version directory under path and switch path/CURRENT to it atomically
+        """
+        os.makedirs(path, exist_ok=True)
+        version = f"v{time.time_ns()}"
+        version_dir = os.path.join(path, version)
+        os.makedirs(version_dir)
+
+        for name in ARRAYS + ("centroids",):
+            np.save(os.path.join(version_dir, name + ".npy"), getattr(self, name))
+        np.save(
+            os.path.join(version_dir, "meta.npy"),
+            np.array([self.n_sorted, self.n_probe], dtype=np.int64),
+        )
+        np.save(os.path.join(version_dir, "offsets.npy"), self.offsets)
+        with open(os.path.join(version_dir, "backend"), "w") as f:
+            f.write(self.backend)
+
+        tmp = os.path.join(path, "CURRENT.tmp")
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(path, "CURRENT"))
+
+        # remove old versions; readers that already mapped them keep their open files
+        versions = sorted(d for d in os.listdir(path) if d.startswith("v"))
+        for old in versions[:-keep_versions]:
+            shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load the current version under path and apply its segments. Returns None if no index has been saved.
+        The arrays stay memory-mapped only while the version has no segment.
+        """
+        version = current_version(path)
+        if version is None:
+            return None
+
+        version_dir = os.path.join(path, version)
+        with open(os.path.join(version_dir, "backend")) as f:
+            backend = f.read().strip()
+        n_sorted, n_probe = np.load(os.path.join(version_dir, "meta.npy")).tolist()
+
+        index = cls(backend, n_probe=n_probe)
+        mmap_mode = "r" if mmap else None
+        for name in ARRAYS + ("centroids",):
+            setattr(
+                index,
+                name,
+                np.load(os.path.join(version_dir, name + ".npy"), mmap_mode=mmap_mode),
+            )
+        index.offsets = np.load(os.path.join(version_dir, "offsets.npy"))
+        index.n_sorted = n_sorted
+
+        for segment in segment_names(path, version):
+            with np.load(os.path.join(version_dir, SEGMENTS_DIR, segment)) as rows:
+                index.add(
+                    rows["ids"], rows["betas"], rows["genders"], rows["heights"], rows["goods"]
+                )
+        return index
+
+
+def segment_names(path, version):
+    """
+    segments appended to a version, in the order they were written
+    """
+    try:
+        names = os.listdir(os.path.join(path, version, SEGMENTS_DIR))
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if name.endswith(".npz"))
+
+
+def append_segment(path, ids, betas, genders, heights, goods):
+    """
+    Write reviews as a segment of the current version instead of rewriting the whole index.
+    Must be called under index_lock(path) with an existing version.
+    """
+    segments_dir = os.path.join(path, current_version(path), SEGMENTS_DIR)
+    os.makedirs(segments_dir, exist_ok=True)
+
+    # written under a temporary name, readers only list complete segments
+    tmp = os.path.join(segments_dir, "segment.tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            ids=np.asarray(ids, dtype=np.int64),
+            betas=np.asarray(betas, dtype=np.float32),
+            genders=np.asarray(genders, dtype="U1"),
+            heights=np.asarray(heights, dtype=np.float32),
+            goods=np.asarray(goods, dtype=np.int64),
+        )
+    os.replace(tmp, os.path.join(segments_dir, f"s{time.time_ns()}.npz"))
+
+
+def current_version(path):
+    try:
+        with open(os.path.join(path, "CURRENT")) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def index_lock(path):
+    """
+    인덱스를 읽고-수정하고-저장하는 동안 다른 프로세스의 수정을 막음
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# django integration
+
+_loaded = {"generation": None, "index": None}
+
+
+def _index_dir():
+    from django.conf import settings
+
+    return str(settings.BODY_SHAPE_INDEX_DIR)
+
+
+def _review_rows(reviews):
+    reviews = [review for review in reviews if review.betas is not None]
+    betas = np.frombuffer(
+        b"".join(bytes(review.betas) for review in reviews), dtype=BETAS_DTYPE
+    ).reshape(-1, NUM_BETAS)
+    return (
+        [review.id for review in reviews],
+        betas,
+        [review.gender for review in reviews],
+        [review.height for review in reviews],
+        [review.good_id for review in reviews],
+    )
+
+
+def get_index():
+    """
+    현재 버전의 인덱스 반환. 다른 프로세스가 새 버전이나 segment를 저장했으면 다시 로드
+    """
+    path = _index_dir()
+    version = current_version(path)
+    generation = (version, tuple(segment_names(path, version)) if version else ())
+    if generation != _loaded["generation"]:
+        _loaded["index"] = BodyShapeIndex.load(path)
+        _loaded["generation"] = generation
+    return _loaded["index"]
+
+
+def rebuild_index(backend=None, n_lists=None):
+    """
+    DB의 betas가 있는 모든 리뷰로 인덱스를 새로 만들어 저장
+    """
+    from django.conf import settings
+    from recommender.models import Review
+
+    backend = backend or settings.BODY_SHAPE_INDEX_BACKEND
+    reviews = Review.objects.filter(betas__isnull=False).only(
+        "id", "betas", "gender", "height", "good_id"
+    )
+    path = _index_dir()
+    with index_lock(path):
+        index = BodyShapeIndex.build(
+            *_review_rows(reviews.iterator(chunk_size=2000)),
+            backend=backend,
+            n_lists=n_lists,
+        )
+        index.save(path)
+    return index
+
+
+def add_reviews_to_index(reviews):
+    """
+    새로 저장되거나 betas가 바뀐 리뷰를 인덱스에 반영. 인덱스가 아직 없으면 새로 만듦
+    저장할 때마다 인덱스 전체를 다시 쓰지 않고 segment로 덧붙이며,
+    segment가 BODY_SHAPE_INDEX_MAX_SEGMENTS개가 되면 새 버전으로 합침
+    """
+    from django.conf import settings
+
+    rows = _review_rows(reviews)
+    if len(rows[0]) == 0:
+        return
+
+    path = _index_dir()
+    with index_lock(path):
+        version = current_version(path)
+        if (
+            version is not None
+            and len(segment_names(path, version)) < settings.BODY_SHAPE_INDEX_MAX_SEGMENTS
+        ):
+            append_segment(path, *rows)
+            return
+
+        index = BodyShapeIndex.load(path)
+        if index is None:
+            index = BodyShapeIndex(settings.BODY_SHAPE_INDEX_BACKEND)
+        index.add(*rows)
+        index.save(path)
@@ -0,0 +1,120 @@
+import hashlib
+
+from recommender import metrics
+from recommender.models import Client, Estimation, PrefilterRejection
+
+# pre-filter rejection reasons (body_shape_estimator.prefilter_reason) of review photos
+# the photo has a person, so they are not estimation failures: stored in PrefilterRejection, not in Estimation
+PREFILTER_REJECTIONS = ("small_person", "not_full_body", "cropped_body")
+
+
+def hash_file(f) -> str:
+    """
+    sha256 of an uploaded / opened django File, same digest as scraper.spool.image_hash
+    """
+    digest = hashlib.sha256()
+    for chunk in f.chunks():
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def find_estimations(image_hashes) -> dict:
+    """
+    image_hash -> Estimation for the hashes estimated before
+    """
+    image_hashes = [h for h in image_hashes if h]
+    if len(image_hashes) == 0:
+        return {}
+    return {
+        est.image_hash: est
+        for est in Estimation.objects.filter(image_hash__in=image_hashes)
+    }
+
+
+def reuse_estimation(client: Client) -> bool:
+    """
+    같은 사진의 추정 결과가 있으면 client에 betas / overlayed_image를 채우고 저장, 재사용했으면 True
+    """
+    est = find_estimations([client.image_hash]).get(client.image_hash)
+    metrics.record_dedup("client", hits=int(est is not None), misses=int(est is None))
+    if est is None:
+        return False
+
+    client.betas = est.betas
+    client.estimation_status = (
+        Client.ESTIMATION_FAILED if est.betas is None else Client.ESTIMATION_DONE
+    )
+    if est.overlayed_image:
+        client.overlayed_image.name = est.overlayed_image.name
+    client.save(update_fields=["betas", "estimation_status", "overlayed_image"])
+    return True
+
+
+def reuse_overlay(obj) -> bool:
+    """
+    같은 사진으로 렌더링한 overlayed_image가 있으면 obj(Review, Client)에 채우고 저장, 재사용했으면 True
+    """
+    est = find_estimations([obj.image_hash]).get(obj.image_hash)
+    if est is None or not est.overlayed_image:
+        return False
+    obj.overlayed_image.name = est.overlayed_image.name
+    obj.save(update_fields=["overlayed_image"])
+    return True
+
+
+def record_estimation(image_hash, betas, overlayed_image=None):
+    """
+    image_hash의 추정 결과 저장
+    betas: packed betas, None if the estimation found no person
+    overlayed_image: name of an overlayed image already saved for a review / client, shared without copying
+    """
+    if not image_hash:
+        # saved before image hashes
+        return None
+
+    est, created = Estimation.objects.get_or_create(
+        image_hash=image_hash,
+        defaults={"betas": betas, "overlayed_image": overlayed_image},
+    )
+    if created:
+        return est
+
+    update_fields = []
+    if est.betas is None and betas is not None:
+        est.betas = betas
+        update_fields.append("betas")
+    if not est.overlayed_image and overlayed_image:
+        est.overlayed_image.name = overlayed_image
+        update_fields.append("overlayed_image")
+    if len(update_fields) > 0:
+        est.save(update_fields=update_fields)
+    return est
+
+
+def find_rejections(image_hashes) -> dict:
+    """
+    image_hash -> pre-filter rejection reason for the review photos rejected before
+    """
+    image_hashes = [h for h in image_hashes if h]
+    if len(image_hashes) == 0:
+        return {}
+    return dict(
+        PrefilterRejection.objects.filter(image_hash__in=image_hashes).values_list(
+            "image_hash", "reason"
+        )
+    )
+
+
+def record_rejection(image_hash, reason, good_id=None, source_url="") -> bool:
+    """
+    image_hash의 pre-filter rejection 저장, 처음 저장했으면 True
+    """
+    if not image_hash:
+        return False
+
+    _, created = PrefilterRejection.objects.get_or_create(
+        image_hash=image_hash,
+        defaults={"reason": reason, "good_id": good_id, "source_url": source_url or ""},
+    )
+    return created
@@ -0,0 +1,72 @@
+"""
+estimate 워커 프로세스가 살아있는 동안 BodyShapeEstimator를 한 번만 로드해 공유하는 레지스트리
+
+torch 등 conda 환경이 필요한 모듈은 load_estimator() 안에서 import 하므로
+pipenv 환경(scrape 워커, 장고 서버)에서도 이 모듈은 import 할 수 있다.
+"""
+import threading
+import time
+
+_lock = threading.Lock()
+_estimator = None
+_status = {
+    "ready": False,  # 모델 로드 완료 여부
+    "loading": False,
+    "warmed_up": False,  # dummy inference 완료 여부
+    "load_seconds": None,
+    "error": None,  # 마지막 로드 실패 사유
+}
+
+
+def load_estimator(warmup=False):
+    """
+    BodyShapeEstimator를 로드해 레지스트리에 등록. 이미 로드되어 있으면 그대로 반환
+
+    Input:
+     - warmup: True면 로드 후 dummy inference를 한 번 실행
+    Output:
+     - BodyShapeEstimator instance
+    """
+    global _estimator
+
+    with _lock:
+        if _estimator is None:
+            # import the modules that require the conda environment
+            from recommender.body_shape_estimator import BodyShapeEstimator
+
+            _status["loading"] = True
+            start = time.perf_counter()
+            try:
+                _estimator = BodyShapeEstimator()
+            except Exception as e:
+                _status["loading"] = False
+                _status["error"] = repr(e)
+                raise
+
+            _status["loading"] = False
+            _status["ready"] = True
+            _status["error"] = None
+            _status["load_seconds"] = time.perf_counter() - start
+
+        if warmup and not _status["warmed_up"]:
+            _estimator.warmup()
+            _status["warmed_up"] = True
+
+    return _estimator
+
+
+def get_estimator():
+    """
+    레지스트리에 로드된 BodyShapeEstimator 반환. worker_process_init에서 로드되지 않았으면(solo pool 등) 이 때 로드
+    """
+    if _estimator is not None:
+        return _estimator
+    return load_estimator()
+
+
+def estimator_status():
+    """
+    health/readiness 확인용 상태 dictionary 반환
+    """
+    # 로드 중에도 "loading" 상태를 확인할 수 있도록 lock을 잡지 않음
+    return dict(_status)
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recommender.body_shape_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "betas가 있는 모든 리뷰로 체형 인덱스(recommender.body_shape_index)를 다시 만듦"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            choices=["exact", "ivf"],
+            help="index backend (default: settings.BODY_SHAPE_INDEX_BACKEND)",
+        )
+        parser.add_argument(
+            "--n-lists", type=int, help="number of ivf lists (default: sqrt(n))"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        index = rebuild_index(backend=options["backend"], n_lists=options["n_lists"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"indexed {len(index)} reviews ({index.backend}) "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+        )
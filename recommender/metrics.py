@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core.cache import caches
+
+# counters shared by the web server and the scrape workers, stored in settings.METRICS_CACHE
+DEDUP_KINDS = ("review", "client")
+# body_shape_estimator rejection reasons
+PREFILTER_REASONS = ("decode_failed", "no_person", "small_person", "not_full_body", "cropped_body")
+
+
+def _cache():
+    return caches[settings.METRICS_CACHE]
+
+
+def _key(name):
+    return f"metrics:{name}"
+
+
+def incr(name, n=1):
+    """
+    increase counter name by n
+    the file based cache increments with get + set, concurrent increments may be lost
+    """
+    cache = _cache()
+    try:
+        cache.incr(_key(name), n)
+    except ValueError:
+        # first increment
+        if not cache.add(_key(name), n, timeout=None):
+            cache.incr(_key(name), n)
+
+
+def get_counts(names):
+    values = _cache().get_many([_key(name) for name in names])
+    return {name: values.get(_key(name), 0) for name in names}
+
+
+def record_dedup(kind, hits, misses):
+    """
+    count image hash lookups of Estimation, kind: "review" | "client"
+    """
+    if hits > 0:
+        incr(f"dedup:{kind}:hits", hits)
+    if misses > 0:
+        incr(f"dedup:{kind}:misses", misses)
+
+
+def dedup_stats():
+    """
+    Estimation 재사용 hit rate
+    {"review": {"hits": 10, "misses": 30, "hit_rate": 0.25}, "client": {...}}
+    """
+    stats = {}
+    for kind in DEDUP_KINDS:
+        counts = get_counts([f"dedup:{kind}:hits", f"dedup:{kind}:misses"])
+        hits = counts[f"dedup:{kind}:hits"]
+        misses = counts[f"dedup:{kind}:misses"]
+        total = hits + misses
+        stats[kind] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total > 0 else None,
+        }
+    return stats
+
+
+def record_prefilter(reasons):
+    """
+    count review images estimated for the first time by rejection reason, None for an accepted image
+    images reused from Estimation / PrefilterRejection are not counted again
+    """
+    counts = {}
+    for reason in reasons:
+        name = f"prefilter:{reason or 'accepted'}"
+        counts[name] = counts.get(name, 0) + 1
+    for name, n in counts.items():
+        incr(name, n)
+
+
+def prefilter_stats():
+    """
+    체형 추정 전 pre-filter에서 버려진 리뷰 사진 수
+    {"accepted": 70, "rejected": {"no_person": 10, ...}, "rejection_rate": 0.3}
+    """
+    counts = get_counts([f"prefilter:{name}" for name in ("accepted",) + PREFILTER_REASONS])
+    accepted = counts["prefilter:accepted"]
+    rejected = {reason: counts[f"prefilter:{reason}"] for reason in PREFILTER_REASONS}
+    total = accepted + sum(rejected.values())
+    return {
+        "accepted": accepted,
+        "rejected": rejected,
+        "rejection_rate": sum(rejected.values()) / total if total > 0 else None,
+    }
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0002_alter_client_formatted_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='betas',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='betas',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Backfill Client.betas and Review.betas from the pickled inferred_model files
+
+import pickle
+
+from django.db import migrations
+
+from recommender.betas import pack_betas
+
+BATCH_SIZE = 500
+
+
+def backfill_betas(apps, schema_editor):
+    for model_name in ("Client", "Review"):
+        model = apps.get_model("recommender", model_name)
+        queryset = model.objects.filter(betas__isnull=True).exclude(inferred_model="")
+
+        batch = []
+        for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+            if not obj.inferred_model:
+                continue
+            try:
+                with obj.inferred_model.open("rb") as f:
+                    obj.betas = pack_betas(pickle.load(f))
+            except (OSError, ValueError, pickle.UnpicklingError) as e:
+                print(f"failed to backfill betas of {model_name} {obj.id}: {e}")
+                continue
+
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ["betas"])
+                batch = []
+
+        if batch:
+            model.objects.bulk_update(batch, ["betas"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0003_client_betas_review_betas'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_betas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0 on 2026-10-18 02:30
+
+from django.db import migrations, models
+
+
+def set_existing_status(apps, schema_editor):
+    # clients created before the async API were estimated synchronously
+    Client = apps.get_model("recommender", "Client")
+    Client.objects.filter(betas__isnull=False).update(estimation_status="done")
+    Client.objects.filter(betas__isnull=True).update(estimation_status="failed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0004_backfill_betas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='estimation_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=8),
+        ),
+        migrations.RunPython(set_existing_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0005_client_estimation_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='good',
+            name='scraped_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.0 on 2026-10-18 02:43
+
+import hashlib
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill_image_hashes(apps, schema_editor):
+    # hash the saved images and keep the first estimation of each image for reuse
+    Estimation = apps.get_model("recommender", "Estimation")
+    estimations = {}
+
+    for model_name in ("Review", "Client"):
+        model = apps.get_model("recommender", model_name)
+        queryset = model.objects.filter(image_hash="").exclude(image="")
+
+        batch = []
+        for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+            digest = hashlib.sha256()
+            try:
+                with obj.image.open("rb") as f:
+                    for chunk in f.chunks():
+                        digest.update(chunk)
+            except OSError as e:
+                print(f"failed to hash image of {model_name} {obj.id}: {e}")
+                continue
+            obj.image_hash = digest.hexdigest()
+
+            if obj.betas is not None and obj.image_hash not in estimations:
+                estimations[obj.image_hash] = Estimation(
+                    image_hash=obj.image_hash,
+                    betas=obj.betas,
+                    overlayed_image=obj.overlayed_image.name or None,
+                )
+
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ["image_hash"])
+                batch = []
+
+        if batch:
+            model.objects.bulk_update(batch, ["image_hash"])
+
+    Estimation.objects.bulk_create(estimations.values(), batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0006_good_scraped_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Estimation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_hash', models.CharField(max_length=64, unique=True)),
+                ('betas', models.BinaryField(blank=True, null=True)),
+                ('overlayed_image', models.ImageField(blank=True, null=True, upload_to='estimations/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(backfill_image_hashes, migrations.RunPython.noop),
+    ]
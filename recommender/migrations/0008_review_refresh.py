@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-18 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0007_image_hash_estimation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='good',
+            name='review_high_water',
+            field=models.CharField(blank=True, max_length=512),
+        ),
+        migrations.AddField(
+            model_name='good',
+            name='reviews_refreshed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='source_url',
+            field=models.CharField(blank=True, db_index=True, max_length=512),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0008_review_refresh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='overlay_failed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='overlay_failed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0009_overlay_failed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='good',
+            name='review_resume_at',
+            field=models.CharField(blank=True, max_length=512),
+        ),
+        migrations.AddField(
+            model_name='good',
+            name='review_resume_top',
+            field=models.CharField(blank=True, max_length=512),
+        ),
+    ]
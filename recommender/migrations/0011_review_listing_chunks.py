@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0010_review_resume'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='good',
+            name='review_chunks_pending',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='good',
+            name='review_listing_token',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-18 03:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0011_review_listing_chunks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrefilterRejection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_hash', models.CharField(max_length=64, unique=True)),
+                ('source_url', models.CharField(blank=True, max_length=512)),
+                ('reason', models.CharField(max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('good', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='recommender.good')),
+            ],
+        ),
+    ]
@@ -6,6 +6,13 @@ class Good(models.Model):
     image = models.ImageField(upload_to='goods/') # 상품 이미지
     brand = models.ForeignKey('Brand', on_delete=models.CASCADE) # brand 모델에 대한 ForeignKey
     name = models.CharField(max_length=128) # 최대 128자
+    scraped_at = models.DateTimeField(null=True, blank=True) # 상품정보를 마지막으로 스크레이핑한 시각
+    reviews_refreshed_at = models.DateTimeField(null=True, blank=True) # 리뷰를 마지막으로 스크레이핑한 시각
+    review_high_water = models.CharField(max_length=512, blank=True) # 최신순 리뷰 목록을 끝까지(이전 high-water mark까지) 읽었을 때 가장 최신 리뷰의 사진 URL
+    review_resume_top = models.CharField(max_length=512, blank=True) # max_photos에서 멈춘 refresh가 읽은 범위의 가장 최신 리뷰 사진 URL, 다음 refresh가 건너뜀
+    review_resume_at = models.CharField(max_length=512, blank=True) # 위 범위의 마지막 리뷰 사진 URL, 다음 refresh는 그 다음 리뷰부터 high-water mark까지 읽음
+    review_listing_token = models.CharField(max_length=32, blank=True) # chord 없이 저장 중인 estimate_reviews()의 id
+    review_chunks_pending = models.IntegerField(default=0) # 위 estimate_reviews()에서 아직 저장되지 않은 chunk 수, 0이 되면 리뷰 목록 진행 상태 기록
 
 # 상품의 브랜드
 class Brand(models.Model):
@@ -17,12 +24,24 @@ class Client(models.Model):
         ('M', 'Male'),
         ('F', 'Female'),
     )
+    ESTIMATION_PENDING = 'pending'
+    ESTIMATION_DONE = 'done'
+    ESTIMATION_FAILED = 'failed'
+    ESTIMATION_STATUS_CHOICES = (
+        (ESTIMATION_PENDING, 'Pending'),
+        (ESTIMATION_DONE, 'Done'),
+        (ESTIMATION_FAILED, 'Failed'),
+    )
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES) # 성별 선택
     height = models.FloatField() # 고객의 키
     image = models.ImageField(upload_to='clients/') # 고객의 전신 사진
+    image_hash = models.CharField(max_length=64, blank=True, db_index=True) # 전신 사진의 sha256, Estimation 조회에 사용
     formatted_image = models.ImageField(upload_to='clients/', null=True, blank=True) # crop, format된 전신 사진, null 허용
     inferred_model = models.FileField(upload_to='clients/', null=True, blank=True) # 추론 결과로 저장된 파일(pkl), null 허용
+    betas = models.BinaryField(null=True, blank=True) # 추론된 체형 파라미터 10개(float32), recommender.betas로 변환, null 허용
+    estimation_status = models.CharField(max_length=8, choices=ESTIMATION_STATUS_CHOICES, default=ESTIMATION_PENDING) # 체형 추정 진행 상태
     overlayed_image = models.ImageField(upload_to='clients/', null=True, blank=True) # 전신 사진 + 3D 모델 겹친 이미지, null 허용
+    overlay_failed = models.BooleanField(default=False) # overlayed_image 렌더링 실패 여부, True면 다시 렌더링하지 않음
     model_image = models.ImageField(upload_to='clients/', null=True, blank=True) # 중립 자세의 3D 모델 사진, null 허용
 
 # review 모델은 상품에 대한 리뷰와 3D 모델을 나타냅니다.
@@ -34,7 +53,33 @@ class Review(models.Model):
     height = models.FloatField() # 리뷰 작성자의 키
     weight = models.FloatField() # 리뷰 작성자의 몸무게
     image = models.ImageField(upload_to='reviews/') # 리뷰 작성자의 전신 사진
+    image_hash = models.CharField(max_length=64, blank=True, db_index=True) # 전신 사진의 sha256, Estimation 조회에 사용
+    source_url = models.CharField(max_length=512, blank=True, db_index=True) # 무신사 리뷰 목록의 사진 URL, 이미 저장한 리뷰인지 확인에 사용
     formatted_image = models.ImageField(upload_to='reviews/', null=True, blank=True) # 자르고 정렬된 전신 사진, null 허용
     inferred_model = models.FileField(upload_to='reviews/', null=True, blank=True) # 추론 결과로 저장된 파일(pkl), null 허용
+    betas = models.BinaryField(null=True, blank=True) # 추론된 체형 파라미터 10개(float32), recommender.betas로 변환, null 허용
     overlayed_image = models.ImageField(upload_to='reviews/', null=True, blank=True) # 전신 사진 + 3D 모델 겹친 이미지, null 허용
+    overlay_failed = models.BooleanField(default=False) # overlayed_image 렌더링 실패 여부, True면 다시 렌더링하지 않음
     model_image = models.ImageField(upload_to='reviews/', null=True, blank=True) # 중립 자세의 3D 모델 사진, null 허용
+
+# estimation 모델은 같은 사진(sha256)에 대한 체형 추정 결과를 리뷰와 유저가 재사용하도록 저장합니다.
+class Estimation(models.Model):
+    image_hash = models.CharField(max_length=64, unique=True) # 사진의 sha256
+    betas = models.BinaryField(null=True, blank=True) # 추론된 체형 파라미터 10개(float32), null이면 사진에서 사람을 찾지 못함
+    overlayed_image = models.ImageField(upload_to='estimations/', null=True, blank=True) # 전신 사진 + 3D 모델 겹친 이미지, null 허용
+    created_at = models.DateTimeField(auto_now_add=True) # 추정 시각
+
+    admin_list_display = ('image_hash', 'overlayed_image', 'created_at')
+    admin_list_filter = ('created_at',)
+
+# prefilter_rejection 모델은 pre-filter에서 버려진 리뷰 사진(sha256)을 저장해, refresh가 다시 받거나 추정하지 않도록 합니다.
+# 사람이 있는 사진이므로 유저가 같은 사진을 올리면 추정하도록 Estimation에는 저장하지 않습니다.
+class PrefilterRejection(models.Model):
+    image_hash = models.CharField(max_length=64, unique=True) # 사진의 sha256
+    good = models.ForeignKey('Good', on_delete=models.CASCADE, null=True, blank=True) # 처음 버려진 리뷰의 상품
+    source_url = models.CharField(max_length=512, blank=True) # 무신사 리뷰 목록의 사진 URL, refresh가 다시 받지 않음
+    reason = models.CharField(max_length=16) # body_shape_estimator의 rejection reason (small_person 등)
+    created_at = models.DateTimeField(auto_now_add=True) # 버려진 시각
+
+    admin_list_display = ('image_hash', 'good', 'reason', 'created_at')
+    admin_list_filter = ('reason', 'created_at')
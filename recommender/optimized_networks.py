@@ -0,0 +1,367 @@
+"""
+TorchScript export of the BodyShapeEstimator networks and the runtime that loads them (conda environment)
+
+export, then check the betas against the eager networks:
+python -m recommender.optimized_networks <image> [<image> ...] [--quantize] [--out DIR] [--atol 1e-3]
+
+- YOLOv4, the pose estimator, the IK net and the feature extractor are traced on inputs built from the
+  given images and frozen (conv / batchnorm folding), then optimized for CPU inference when loaded
+- the traces are checked at the batch sizes of CHECK_BATCH_SIZES (1, an odd size and ESTIMATE_BATCH_SIZE)
+  so a shape baked in at tracing time is caught
+- --quantize: dynamic int8 quantization of the Linear layers before tracing (the conv layers stay float)
+- a network that cannot be traced is skipped, BodyShapeEstimator keeps its eager module
+- the export fails if a traced network differs from its module by more than TRACE_ATOL at a checked batch
+  size, or if the betas of the shape only pipeline differ from the eager ones by more than atol at a
+  checked batch size
+"""
+import argparse
+import json
+import os
+import pickle
+from collections import namedtuple
+
+import torch
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# directory of the exported networks, loaded by BodyShapeEstimator when ESTIMATOR_RUNTIME=torchscript
+OPTIMIZED_DIR = os.getenv("ESTIMATOR_OPTIMIZED_DIR") or os.path.join(BASE_DIR, "optimized")
+
+NETWORKS = ("yolo", "pose_estimator", "ik_net", "feature_extractor")
+MANIFEST = "manifest.json"
+# skeleton indices and edges returned by the pose estimator, pickled since they may not be tensors
+POSE_CONSTANTS = "pose_constants.pkl"
+
+# batch sizes the traced networks are checked at: single images (clients), an odd size and the
+# batch size of the estimate workers
+ESTIMATE_BATCH_SIZE = int(os.getenv("ESTIMATE_BATCH_SIZE", "8"))
+CHECK_BATCH_SIZES = sorted({1, 3, ESTIMATE_BATCH_SIZE})
+# max abs difference between a traced network and its (quantized) module
+TRACE_ATOL = 1e-4
+
+# same attributes as the eager ik_net output
+IKNetOutput = namedtuple("IKNetOutput", ["pred_rot6d", "pred_shape"])
+
+
+class PoseEstimatorExport(torch.nn.Module):
+    """
+    traceable pose estimator: skeleton indices and edges are constants, only the joints are returned
+    """
+
+    def __init__(self, pose_estimator):
+        super().__init__()
+        self.pose_estimator = pose_estimator
+
+    def forward(self, img, intrinsic, default_intrinsic):
+        j2d, j3d, j3d_abs, _, _ = self.pose_estimator(img, intrinsic, default_intrinsic)
+        return j2d, j3d, j3d_abs
+
+
+class IKNetExport(torch.nn.Module):
+    """
+    traceable ik_net: the output object is returned as a tuple
+    """
+
+    def __init__(self, ik_net):
+        super().__init__()
+        self.ik_net = ik_net
+
+    def forward(self, img, j3d_abs_meter):
+        output = self.ik_net(img, j3d_abs_meter)
+        return output.pred_rot6d, output.pred_shape
+
+
+class FeatureExtractorExport(torch.nn.Module):
+    """
+    traceable feature extractor, forward() is extract()
+    """
+
+    def __init__(self, feature_extractor):
+        super().__init__()
+        self.feature_extractor = feature_extractor
+
+    def forward(self, img):
+        return self.feature_extractor.extract(img)
+
+
+class ScriptedPoseEstimator:
+    def __init__(self, module, skeleton_indices, edges):
+        self.module = module
+        self.skeleton_indices = skeleton_indices
+        self.edges = edges
+
+    def __call__(self, img, intrinsic, default_intrinsic):
+        j2d, j3d, j3d_abs = self.module(img, intrinsic, default_intrinsic)
+        return j2d, j3d, j3d_abs, self.skeleton_indices, self.edges
+
+
+class ScriptedIKNet:
+    def __init__(self, module):
+        self.module = module
+
+    def __call__(self, img, j3d_abs_meter):
+        return IKNetOutput(*self.module(img, j3d_abs_meter))
+
+
+class ScriptedFeatureExtractor:
+    def __init__(self, module):
+        self.module = module
+
+    def extract(self, img):
+        return self.module(img)
+
+
+def network_path(optimized_dir, name):
+    return os.path.join(optimized_dir, name + ".pt")
+
+
+def load_optimized_networks(bse, optimized_dir=OPTIMIZED_DIR):
+    """
+    Replace the eager networks of a BodyShapeEstimator with the exported ones found in optimized_dir.
+
+    Input:
+     - bse: BodyShapeEstimator
+     - optimized_dir: output directory of the export
+    Output:
+     - names of the replaced networks
+    """
+    manifest_path = os.path.join(optimized_dir, MANIFEST)
+    if not os.path.exists(manifest_path):
+        print(f"no exported networks in {optimized_dir}, using the eager networks")
+        return []
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest["torch"] != torch.__version__:
+        print(
+            f"networks exported with torch {manifest['torch']}, running {torch.__version__}"
+        )
+
+    loaded = []
+    for name in manifest["networks"]:
+        module = torch.jit.load(network_path(optimized_dir, name), map_location="cpu")
+        try:
+            module = torch.jit.optimize_for_inference(module)
+        except Exception as e:
+            print(f"{name}: optimize_for_inference failed, using the frozen module: {e!r}")
+        if name == "yolo":
+            bse.yolo = module
+        elif name == "pose_estimator":
+            with open(os.path.join(optimized_dir, POSE_CONSTANTS), "rb") as f:
+                constants = pickle.load(f)
+            bse.pose_estimator = ScriptedPoseEstimator(
+                module, constants["skeleton_indices"], constants["edges"]
+            )
+        elif name == "ik_net":
+            bse.ik_net = ScriptedIKNet(module)
+        elif name == "feature_extractor":
+            bse.feature_extractor = ScriptedFeatureExtractor(module)
+        loaded.append(name)
+
+    print(f"loaded exported networks: {loaded} (quantized: {manifest['quantized']})")
+    return loaded
+
+
+def sample_inputs(bse, imgfiles):
+    """
+    Network inputs built from the primary person of the given images, as the estimator builds them.
+
+    Output:
+     - {network name: tuple of input tensors}, pose estimator constants
+    """
+    import cv2
+    from lib.utils.input_utils import (
+        get_pose_estimator_input,
+        get_feature_extractor_input,
+        get_ik_input,
+    )
+    from recommender.body_shape_estimator import (
+        read_image,
+        select_primary_person,
+        split_person_patches,
+    )
+
+    yolo_inputs = []
+    patches = []
+    for imgfile in imgfiles:
+        orig_img, _ = read_image(imgfile)
+        if orig_img is None:
+            continue
+        # do_detect input: RGB, NCHW, [0, 1]
+        yolo_input = cv2.cvtColor(
+            cv2.resize(orig_img, (bse.width, bse.height)), cv2.COLOR_BGR2RGB
+        )
+        yolo_inputs.append(torch.from_numpy(yolo_input.transpose(2, 0, 1)).float().div(255.0))
+
+        primary_box = select_primary_person(bse.detect(orig_img), bse.class_names)
+        if primary_box is not None:
+            img_patch_list, _, _ = split_person_patches(orig_img, [primary_box], bse.class_names)
+            patches += img_patch_list
+
+    if len(patches) == 0:
+        raise ValueError("no person found in the export images")
+
+    with torch.no_grad():
+        pe_inputs = [get_pose_estimator_input(p, bse.FLAGS) for p in patches]
+        img_pe_input = torch.cat([img_pe_input for _, img_pe_input, _ in pe_inputs])
+        intrinsic = torch.cat([intrinsic for _, _, intrinsic in pe_inputs])
+        _, _, j3d_abs, skeleton_indices, edges = bse.pose_estimator(
+            img_pe_input, intrinsic, intrinsic
+        )
+        img_ik_input = torch.cat([get_ik_input(p, bse.demo_cfg, bse.FLAGS) for p in patches])
+        img_fe_input = torch.cat([get_feature_extractor_input(p) for p in patches])
+
+    inputs = {
+        "yolo": (torch.stack(yolo_inputs),),
+        "pose_estimator": (img_pe_input, intrinsic, intrinsic),
+        "ik_net": (img_ik_input, j3d_abs / 1000),
+        "feature_extractor": (img_fe_input,),
+    }
+    return inputs, {"skeleton_indices": skeleton_indices, "edges": edges}
+
+
+def resize_batch(inputs, batch_size):
+    """
+    the sample input tensors repeated / truncated to batch_size along the batch dimension
+    """
+    return tuple(x[torch.arange(batch_size) % x.shape[0]] for x in inputs)
+
+
+def max_abs_diff(a, b):
+    """
+    largest difference between two (nested tuples of) tensors
+    """
+    if isinstance(a, (tuple, list)):
+        return max(max_abs_diff(x, y) for x, y in zip(a, b))
+    return (a.float() - b.float()).abs().max().item()
+
+
+def export_networks(bse, imgfiles, optimized_dir=OPTIMIZED_DIR, quantize=False):
+    """
+    Trace the networks of an eager BodyShapeEstimator into optimized_dir.
+
+    Input:
+     - bse: BodyShapeEstimator with the eager networks
+     - imgfiles: images with a person, used as tracing inputs
+     - optimized_dir: output directory
+     - quantize: dynamic int8 quantization of the Linear layers
+    Output:
+     - {network name: max abs difference between the traced and the eager outputs over CHECK_BATCH_SIZES}
+    Raises ValueError if a traced network differs from its module at one of CHECK_BATCH_SIZES.
+    """
+    inputs, pose_constants = sample_inputs(bse, imgfiles)
+    modules = {
+        "yolo": bse.yolo,
+        "pose_estimator": PoseEstimatorExport(bse.pose_estimator),
+        "ik_net": IKNetExport(bse.ik_net),
+        "feature_extractor": FeatureExtractorExport(bse.feature_extractor),
+    }
+
+    os.makedirs(optimized_dir, exist_ok=True)
+    diffs = {}
+    for name in NETWORKS:
+        module = modules[name].eval()
+        if quantize:
+            module = torch.ao.quantization.quantize_dynamic(
+                module, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        check_inputs = [resize_batch(inputs[name], n) for n in CHECK_BATCH_SIZES]
+        try:
+            with torch.no_grad():
+                # the trace is rerun on check_inputs, a batch size baked into the graph fails here
+                traced = torch.jit.trace(
+                    module, inputs[name], check_inputs=check_inputs, check_tolerance=TRACE_ATOL
+                )
+                # optimize_for_inference is left to the runtime, its MKLDNN constants cannot be saved
+                traced = torch.jit.freeze(traced.eval())
+        except torch.jit.TracingCheckError as e:
+            raise ValueError(f"{name}: trace does not generalize to batch sizes {CHECK_BATCH_SIZES}") from e
+        except Exception as e:
+            print(f"{name}: could not be traced, keeping the eager module: {e!r}")
+            continue
+
+        # the frozen module at every checked batch size, against the module it was traced from
+        with torch.no_grad():
+            batch_diffs = {
+                n: max_abs_diff(traced(*x), module(*x))
+                for n, x in zip(CHECK_BATCH_SIZES, check_inputs)
+            }
+        diffs[name] = max(batch_diffs.values())
+        if diffs[name] > TRACE_ATOL:
+            raise ValueError(f"{name}: traced outputs differ from the module: {batch_diffs}")
+        traced.save(network_path(optimized_dir, name))
+        print(f"{name}: exported, max abs diff {diffs[name]:.2e} at batch sizes {CHECK_BATCH_SIZES}")
+
+    with open(os.path.join(optimized_dir, POSE_CONSTANTS), "wb") as f:
+        pickle.dump(pose_constants, f)
+    with open(os.path.join(optimized_dir, MANIFEST), "w") as f:
+        json.dump(
+            {"networks": list(diffs), "quantized": quantize, "torch": torch.__version__},
+            f,
+            indent=2,
+        )
+    return diffs
+
+
+def compare_betas(eager, optimized, imgfiles, batch_size=8):
+    """
+    Input:
+     - eager, optimized: BodyShapeEstimators with the eager and the exported networks
+     - imgfiles: image paths
+     - batch_size: estimate_batch() batch size
+    Output:
+     - max abs difference of the shape only pipeline betas, None if no image was estimated by both
+    """
+    eager_ests = eager.estimate_batch(imgfiles, batch_size=batch_size, betas_only=True)
+    optimized_ests = optimized.estimate_batch(imgfiles, batch_size=batch_size, betas_only=True)
+
+    diff = None
+    for imgfile, a, b in zip(imgfiles, eager_ests, optimized_ests):
+        if (a is None) != (b is None):
+            print(f"{imgfile}: estimated by only one runtime")
+            return float("inf")
+        if a is None:
+            continue
+        d = max(abs(x - y) for x, y in zip(a["betas"], b["betas"]))
+        diff = d if diff is None else max(diff, d)
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--out", default=OPTIMIZED_DIR)
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--atol", type=float, default=None, help="default 1e-3, 5e-2 with --quantize")
+    args = parser.parse_args()
+    atol = args.atol if args.atol is not None else (5e-2 if args.quantize else 1e-3)
+
+    # circular import: body_shape_estimator loads the exported networks through this module
+    from recommender.body_shape_estimator import (
+        RUNTIME_EAGER,
+        RUNTIME_TORCHSCRIPT,
+        BodyShapeEstimator,
+    )
+
+    eager = BodyShapeEstimator(detection_cache_size=0, runtime=RUNTIME_EAGER)
+    try:
+        export_networks(eager, args.images, args.out, quantize=args.quantize)
+    except ValueError as e:
+        raise SystemExit(f"export failed: {e}")
+
+    optimized = BodyShapeEstimator(
+        detection_cache_size=0, runtime=RUNTIME_TORCHSCRIPT, optimized_dir=args.out
+    )
+    # enough images to fill the largest checked batch
+    num_images = max(len(args.images), max(CHECK_BATCH_SIZES))
+    imgfiles = [args.images[i % len(args.images)] for i in range(num_images)]
+    for batch_size in CHECK_BATCH_SIZES:
+        diff = compare_betas(eager, optimized, imgfiles, batch_size=batch_size)
+        if diff is None:
+            raise SystemExit("no person estimated in the images, betas not checked")
+        print(f"batch size {batch_size}: betas max abs diff {diff:.2e} (atol {atol:.0e})")
+        if diff > atol:
+            raise SystemExit("exported networks do not match the eager networks")
+
+
+if __name__ == "__main__":
+    main()
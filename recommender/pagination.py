@@ -0,0 +1,89 @@
+import base64
+import binascii
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from recommender.ranking import next_page
+
+
+class BodyShapeCursorPagination(BasePagination):
+    """
+    유사 체형순 리뷰 목록의 cursor 기반 pagination
+    cursor는 이전 페이지 마지막 리뷰의 (distance, id)이며, 다음 페이지는 그 뒤의 top-k만 선택
+    """
+
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_ranking(self, ids, distances, request):
+        """
+        Input:
+         - ids: (n,) review ids of the candidates
+         - distances: (n,) body shape differences of the candidates
+        Output:
+         - review ids of the requested page, ordered by ascending difference
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        after = self.decode_cursor(request)
+
+        page, has_more = next_page(ids, distances, page_size, after)
+        self.next_cursor = None
+        if has_more:
+            last = page[-1]
+            self.next_cursor = (float(distances[last]), int(ids[last]))
+
+        return [int(ids[i]) for i in page]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("ascii")
+            distance, review_id = querystring.split("|")
+            return (float(distance), int(review_id))
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        distance, review_id = cursor
+        querystring = f"{distance!r}|{review_id}"
+        encoded = base64.urlsafe_b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return self.encode_cursor(self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,84 @@
+"""
+리뷰들을 유저와의 체형 차이(betas cosine distance) 순으로 정렬하는 ranking engine
+리뷰 betas를 하나의 NumPy 행렬로 읽어 한 번의 연산으로 거리를 계산
+"""
+import numpy as np
+
+from recommender.betas import BETAS_DTYPE, NUM_BETAS, unpack_betas
+
+# distance of reviews whose betas are missing: cosine distances are in [0, 2], so they are ranked last
+MISSING_DISTANCE = np.inf
+
+
+def betas_matrix(blobs):
+    """
+    Input:
+     - blobs: list of packed betas (bytes or memoryview), None for missing betas
+    Output:
+     - matrix: np.ndarray of float32 (n, 10), rows of missing betas are zero
+     - valid: np.ndarray of bool (n,), False where betas are missing
+    """
+    valid = np.array([blob is not None for blob in blobs], dtype=bool)
+    matrix = np.zeros((len(blobs), NUM_BETAS), dtype=np.float32)
+    if valid.any():
+        packed = b"".join(bytes(blob) for blob in blobs if blob is not None)
+        matrix[valid] = np.frombuffer(packed, dtype=BETAS_DTYPE).reshape(-1, NUM_BETAS)
+    return matrix, valid
+
+
+def cosine_distances(client_betas, matrix, valid=None):
+    """
+    Input:
+     - client_betas: packed betas or array (10,)
+     - matrix: (n, 10) betas of the reviews
+     - valid: (n,) mask of rows with betas (Optional)
+    Output:
+     - distances: np.ndarray of float64 (n,), MISSING_DISTANCE where betas are missing
+    """
+    if isinstance(client_betas, (bytes, memoryview)):
+        client_betas = unpack_betas(client_betas)
+    client_betas = np.asarray(client_betas, dtype=np.float64)
+    matrix = np.asarray(matrix, dtype=np.float64)
+
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(client_betas)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distances = 1 - (matrix @ client_betas) / norms
+
+    distances[~np.isfinite(distances)] = MISSING_DISTANCE
+    if valid is not None:
+        distances[~valid] = MISSING_DISTANCE
+    return distances
+
+
+def next_page(ids, distances, page_size, after=None):
+    """
+    Keyset page of the ranking ordered by (distance, id), selecting only the page instead of sorting everything.
+
+    Input:
+     - ids: (n,) review ids
+     - distances: (n,) distances of the reviews
+     - page_size: number of reviews in the page
+     - after: (distance, id) of the last review of the previous page (Optional: if None, first page)
+    Output:
+     - page: indices of the reviews in the page, ordered by (distance, id)
+     - has_more: True if reviews remain after the page
+    """
+    ids = np.asarray(ids)
+    distances = np.asarray(distances)
+    if after is None:
+        candidates = np.arange(len(ids))
+    else:
+        last_distance, last_id = after
+        candidates = np.flatnonzero(
+            (distances > last_distance) | ((distances == last_distance) & (ids > last_id))
+        )
+
+    has_more = len(candidates) > page_size
+    if len(candidates) > page_size > 0:
+        # keep every candidate up to the page_size-th distance, ties included
+        candidate_distances = distances[candidates]
+        kth = np.partition(candidate_distances, page_size - 1)[page_size - 1]
+        candidates = candidates[candidate_distances <= kth]
+
+    order = np.lexsort((ids[candidates], distances[candidates]))[:page_size]
+    return candidates[order], has_more
@@ -0,0 +1,110 @@
+"""
+상품별 리뷰 ranking 결과(리뷰 ID 배열, 유저와의 체형 차이 배열) 캐시
+pagination은 캐시된 배열에서 페이지마다 top-k만 선택
+
+- 1차: 프로세스 내 LRU
+- 2차: settings.RANKING_CACHE alias의 장고 캐시 (기본값: 파일 기반, 워커/서버 프로세스 간 공유)
+
+키는 (client_id, good_id, 상품 리뷰 version, client betas version)
+save_result, save_review가 리뷰를 저장하면 invalidate_good()으로 상품 version을 올리고,
+client의 betas가 바뀌면 betas version이 바뀌므로 이전 결과는 더 이상 조회되지 않음
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+LOCAL_CACHE_SIZE = getattr(settings, "RANKING_LOCAL_CACHE_SIZE", 1024)
+CACHE_TIMEOUT = getattr(settings, "RANKING_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LRUCache(LOCAL_CACHE_SIZE)
+
+
+def _backend():
+    return caches[getattr(settings, "RANKING_CACHE", "default")]
+
+
+def _good_version_key(good_id):
+    return f"ranking:good:{good_id}:version"
+
+
+def good_version(good_id):
+    return _backend().get(_good_version_key(good_id), 0)
+
+
+def betas_version(betas):
+    """
+    Input:
+     - betas: packed betas of the client
+    Output:
+     - short hash of the betas, changes whenever the betas change
+    """
+    return hashlib.sha1(bytes(betas)).hexdigest()[:16]
+
+
+def ranking_key(client, good_id):
+    return (
+        f"ranking:distances:{client.id}:{good_id}:"
+        f"{good_version(good_id)}:{betas_version(client.betas)}"
+    )
+
+
+def get_ranking(key):
+    """
+    Output:
+     - cached ranking value, None on a miss
+    """
+    value = _local.get(key)
+    if value is not None:
+        return value
+
+    value = _backend().get(key)
+    if value is not None:
+        _local.set(key, value)
+    return value
+
+
+def set_ranking(key, value):
+    _local.set(key, value)
+    _backend().set(key, value, timeout=CACHE_TIMEOUT)
+
+
+def invalidate_good(good_id):
+    """
+    good_id 상품의 ranking 결과를 모두 무효화
+    """
+    backend = _backend()
+    key = _good_version_key(good_id)
+    try:
+        backend.incr(key)
+    except ValueError:
+        # the version key does not exist yet
+        backend.set(key, 1, timeout=None)
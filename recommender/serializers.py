@@ -16,6 +16,13 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ["id", "image", "height", "weight", "product_size", "content"]
 
+class SimilarReviewSerializer(serializers.ModelSerializer):
+    difference = serializers.FloatField(read_only=True)  # 유저와의 체형 차이(cosine distance)
+
+    class Meta:
+        model = Review
+        fields = ["id", "good", "image", "gender", "height", "weight", "product_size", "content", "difference"]
+
 class ReviewImageSerializer(serializers.ModelSerializer):
     review_overlayed_image = serializers.ImageField(source="overlayed_image")
     review_model_image = serializers.ImageField(source="model_image")
@@ -1,25 +1,127 @@
 import os
+from collections import Counter
 
-from celery import Celery
+from celery import Celery, chain, chord, group
+from celery.signals import celeryd_after_setup, worker_process_init
+from celery.utils.log import current_process_index
+
+from recommender.estimator_registry import (
+    estimator_status,
+    get_estimator,
+    load_estimator,
+)
+from recommender.worker_threads import configure_threads, thread_config
 
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
+# chord로 리뷰 추정 결과를 모으려면 chord를 지원하는 result backend(redis://, db+sqlite:// 등)가 필요
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "amqp://guest@localhost//")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "rpc://")
+# rpc:// results can only be read by the client that sent the task, chord callbacks never fire
+CHORD_SUPPORTED = not CELERY_RESULT_BACKEND.startswith("rpc")
+
 app = Celery(
     "proj",
-    broker="amqp://guest@localhost//",
-    backend="rpc://",
+    broker=CELERY_BROKER_URL,
+    backend=CELERY_RESULT_BACKEND,
 )
+# estimate chunks are long running, a worker reserves one at a time so chunks spread over every estimate worker
+app.conf.worker_prefetch_multiplier = 1
+
+# estimate 워커 프로세스 시작 시 모델을 미리 로드할지, dummy inference로 warm-up 할지
+ESTIMATOR_PRELOAD = os.getenv("ESTIMATOR_PRELOAD", "1") == "1"
+ESTIMATOR_WARMUP = os.getenv("ESTIMATOR_WARMUP", "0") == "1"
+# estimate_mesh에서 한 번의 forward pass로 묶어 추론할 이미지 수
+ESTIMATE_BATCH_SIZE = int(os.getenv("ESTIMATE_BATCH_SIZE", "8"))
+# estimate_reviews()가 estimate_mesh task 하나에 넘기는 리뷰 수, chunk마다 다른 estimate 워커에서 추정 후 바로 저장
+ESTIMATE_CHUNK_SIZE = int(os.getenv("ESTIMATE_CHUNK_SIZE", "8"))
+# 리뷰 저장 후 render 큐에서 mesh 렌더링을 미리 해둘지 (0이면 ReviewBodyShapeView 조회 시 렌더링)
+RENDER_IN_BACKGROUND = os.getenv("RENDER_IN_BACKGROUND", "0") == "1"
+
+# 리뷰 refresh: REVIEW_REFRESH_SECONDS 넘게 리뷰를 스크레이핑하지 않은 상품을
+# beat이 REVIEW_REFRESH_INTERVAL초마다 REVIEW_REFRESH_BATCH개씩, 상품당 새 리뷰 최대 REVIEW_REFRESH_MAX_PHOTOS개 refresh
+REVIEW_REFRESH_SECONDS = int(os.getenv("REVIEW_REFRESH_SECONDS", str(60 * 60 * 24)))
+REVIEW_REFRESH_INTERVAL = int(os.getenv("REVIEW_REFRESH_INTERVAL", str(60 * 60)))
+REVIEW_REFRESH_BATCH = int(os.getenv("REVIEW_REFRESH_BATCH", "20"))
+REVIEW_REFRESH_MAX_PHOTOS = int(os.getenv("REVIEW_REFRESH_MAX_PHOTOS", "30"))
+
+app.conf.beat_schedule = {
+    "refresh-stale-goods": {
+        "task": "recommender.tasks.refresh_stale_goods",
+        "schedule": REVIEW_REFRESH_INTERVAL,
+    },
+}
+
+# queues whose tasks need the MultiPerson model
+MODEL_QUEUES = ("estimate", "render")
+
+# set in the main worker process, inherited by the forked pool processes
+_consumes_model_queue = False
+_pool_concurrency = 1
+
+
+@celeryd_after_setup.connect
+def detect_model_worker(sender, instance, **kwargs):
+    """
+    -Q 옵션으로 estimate/render 큐를 consume 하는 워커인지 기록
+    """
+    global _consumes_model_queue, _pool_concurrency
+    consume_from = instance.app.amqp.queues.consume_from
+    _consumes_model_queue = any(queue in consume_from for queue in MODEL_QUEUES)
+    _pool_concurrency = instance.concurrency
+
+
+@worker_process_init.connect
+def preload_estimator(**kwargs):
+    """
+    estimate/render 워커의 각 프로세스가 시작될 때 스레드 수 / CPU 코어를 정하고 BodyShapeEstimator를 한 번만 로드
+    이후 모든 estimate/render task가 같은 인스턴스를 공유
+    """
+    if not _consumes_model_queue:
+        return
+
+    # before torch is imported by the estimator
+    threads = configure_threads(_pool_concurrency, current_process_index(base=0) or 0)
+    print(f"estimator threads: {threads}")
+
+    if not ESTIMATOR_PRELOAD:
+        return
+
+    load_estimator(warmup=ESTIMATOR_WARMUP)
+    print(f"body shape estimator loaded: {estimator_status()}")
+
+
+@app.task(queue="estimate")
+def estimator_health():
+    """
+    estimate 워커의 모델 로드 상태(health/readiness) 반환
+
+    return:
+        {
+            "ready": bool,
+            "loading": bool,
+            "warmed_up": bool,
+            "load_seconds": float | None,
+            "error": str | None,
+            "threads": {"threads": int, "interop_threads": int | None, "cpus": list | None} | None,
+        }
+    """
+    return {**estimator_status(), "threads": thread_config()}
 
 
 # define a task for scraping the image from musinsa
 @app.task(queue="scrape")
-def scrape_reviews(product_id, max_photos=200):
+def scrape_reviews(product_id, max_photos=200, sort=None, stop_at=None, skip_urls=()):
     """
     product_id를 상품ID로 갖는 상품의 리뷰를 크롤링하는 함수. 아직 DB에 저장하지 않음
     musinsa-scraper.scraper 코드를 조금 손봐서 구현
 
+    sort: 리뷰 목록 정렬, 기본값은 추천순(SORT_POPULAR)
+    stop_at: 이 사진 URL의 리뷰에서 목록 읽기를 멈춤 (refresh_reviews()의 high-water mark)
+    skip_urls: 이미 저장한 리뷰의 사진 URL, 다시 받지 않음
+
     return:
         [
             {
@@ -28,34 +130,58 @@ def scrape_reviews(product_id, max_photos=200):
                 "gender": "M",
                 "height": 170,
                 "weight": 70,
-                "image": str()
+                "image": str(),  # spool path
+                "source_url": str(),  # 무신사 사진 URL
+                "image_hash": str(),  # sha256
+                "betas": None,  # 같은 사진의 추정 결과가 있을 때만, python list (10,) 또는 None(추정 실패)
             },
             ...
         ]
     """
+    reviews, _ = scrape_review_listing(product_id, max_photos, sort, stop_at, skip_urls)
+    return reviews
+
+
+def scrape_review_listing(
+    product_id, max_photos=200, sort=None, stop_at=None, skip_urls=(), skip_range=None
+):
+    """
+    scrape_reviews()와 같고, 리뷰 목록을 어디까지 읽었는지도 함께 리턴
+    skip_range: 이전 refresh가 읽은 (가장 최신, 마지막) 리뷰 사진 URL, 그 사이의 리뷰는 건너뜀
+
+    return: (scrape_reviews()의 리턴값, scraper.scraper.parse_review_listing()의 progress)
+    """
     # import the modules that require the pipenv environment
-    import requests
-    from bs4 import BeautifulSoup
-    from scraper.scraper import parse_reviews, to_size_dict_list
+    import django
+    from recommender import metrics
+    from recommender.betas import unpack_betas
+    from recommender.estimations import find_estimations, find_rejections
+    from scraper.client import get_client, metrics_delta
+    from scraper.parsing import find_size_table
+    from scraper.scraper import ITEM_URL, SORT_POPULAR, parse_review_listing, to_size_dict_list
+    from scraper.spool import cleanup_spool
 
     try:
         int(product_id)
     except (ValueError, TypeError):
         raise ValueError(f"malformed product ID {product_id}")
 
-    BASE_URL = "https://www.musinsa.com/app/goods/"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36 Edg/118.0.2088.76"
-    }
-    # make GET request to product page
-    url = BASE_URL + str(product_id)
-    response = requests.get(url, headers=headers)
+    # remove review images left in the spool by chains that never reached save_result
+    removed = cleanup_spool()
+    if removed > 0:
+        print(f"removed {removed} orphaned spool files")
+
+    client = get_client()
+    # the client is shared by the scrapes of this process, its metrics are cumulative
+    metrics_before = client.metrics()
+    # make GET request to product page, usually cached by the GoodView request that started the scrape
+    url = ITEM_URL + str(product_id)
+    response = client.get_cached(url)
     response.raise_for_status()
 
     html = response.content
-    soup = BeautifulSoup(html, "html.parser")
     # read size table
-    size_table = soup.find("table", id="size_table")
+    size_table = find_size_table(html)
     size_list = to_size_dict_list(size_table)
 
     # save size table as json
@@ -66,19 +192,51 @@ def scrape_reviews(product_id, max_photos=200):
 
     # parse reviews
     size_names = [it["size"] for it in size_list]
-    reviews = parse_reviews(product_id, size_names, max_photos)
-
-    return reviews
+    reviews, progress = parse_review_listing(
+        product_id,
+        size_names,
+        max_photos,
+        sort=sort or SORT_POPULAR,
+        stop_at=stop_at,
+        skip_urls=frozenset(skip_urls),
+        skip_range=skip_range,
+    )
+    print(
+        f"scrape_reviews {product_id} http metrics: "
+        f"{metrics_delta(metrics_before, client.metrics())}"
+    )
+
+    # reuse the betas of review images estimated before, estimate_mesh() skips them
+    # images rejected by the pre-filter before are skipped too, save_result() does not store them
+    django.setup()
+    image_hashes = [review["image_hash"] for review in reviews]
+    estimations = find_estimations(image_hashes)
+    rejections = find_rejections(image_hashes)
+    for review in reviews:
+        est = estimations.get(review["image_hash"])
+        if est is not None:
+            review["betas"] = None if est.betas is None else unpack_betas(est.betas).tolist()
+            review["overlayed_image"] = est.overlayed_image.name or None
+            review["reused"] = True
+        elif review["image_hash"] in rejections:
+            review["betas"] = None
+            review["rejected"] = rejections[review["image_hash"]]
+            review["reused"] = True
+    metrics.record_dedup(
+        "review",
+        hits=sum(review.get("reused", False) for review in reviews),
+        misses=sum(not review.get("reused", False) for review in reviews),
+    )
+
+    return reviews, progress
 
 
 # define a task for running the keypoint estimation on the image
 @app.task(queue="estimate")
 def estimate_mesh(reviews_obj):
     """
-    load MultiPerson model
-
-    scrape_reviews()가 리턴하는 객체에 담긴 리뷰들에 대해 mesh estimation 진행
-    multiperson/demo.py의 코드 이용
+    scrape_reviews()가 리턴하는 객체에 담긴 리뷰들에 대해 체형(betas) estimation 진행
+    mesh 렌더링은 render 큐의 render_mesh()에서 필요할 때 따로 진행
 
     Input:
         - reviews_obj: list of python dict
@@ -94,9 +252,7 @@ def estimate_mesh(reviews_obj):
                 "image": ??,
 
                 "betas":  , # python list (10,)
-                "meshed_image": meshed_image_name , # 원본 이미지에서 추출한 mesh
-                                                                # meshed_image_name = str(uuid.uuid4()) + ".png"
-                # -> /home/myungjune/projects/multiperson/output/maifit_mesh
+                "meshed_image": None,
             },
             ...
         ]
@@ -108,17 +264,26 @@ def estimate_mesh(reviews_obj):
         print(reviews_obj[i])
     print()
 
-    # import the modules that require the conda environment
-    from recommender.body_shape_estimator import BodyShapeEstimator
+    # 같은 사진의 추정 결과를 재사용하는 리뷰(scrape_reviews()에서 betas를 채움)는 건너뜀
+    to_estimate = [review for review in reviews_obj if "betas" not in review]
+    if len(to_estimate) == 0:
+        return reviews_obj
 
-    bse = BodyShapeEstimator()
+    bse = get_estimator()
 
-    for review in reviews_obj:
+    image_paths = []
+    for review in to_estimate:
         image_path = review["image"]
 
         assert os.path.exists(image_path)
 
-        est = bse.extract_betas_and_mesh(image_path)
+        image_paths.append(image_path)
+
+    # 여러 리뷰 이미지의 네트워크 입력을 모아 batch 단위로 추론
+    ests = bse.estimate_batch(
+        image_paths, batch_size=ESTIMATE_BATCH_SIZE, betas_only=True, prefilter=True
+    )
+    for review, est, reason in zip(to_estimate, ests, bse.rejection_reasons):
         # append into review
         if est is not None:
             if "betas" in est:
@@ -126,23 +291,41 @@ def estimate_mesh(reviews_obj):
             if "meshed_image" in est:
                 review["meshed_image"] = est["meshed_image"]
         # if est is None -> review will not have betas, and meshed_image
+        if reason is not None:
+            review["rejected"] = reason  # pre-filter / detection rejection, counted in save_result()
+
+    rejected = Counter(review["rejected"] for review in to_estimate if "rejected" in review)
+    print(f"estimate_mesh rejected {sum(rejected.values())}/{len(to_estimate)}: {dict(rejected)}")
 
     return reviews_obj
 
 
 # define a task for saving the scraped image and the mesh estimation result to the database
 @app.task(queue="scrape")
-def save_result(reviews_mesh_obj, product_id):
+def save_result(reviews_mesh_obj, product_id, listing_token=None, listing=None):
     """
     estimate_mesh()의 결과를 장고ORM 이용해 DB에 저장
+    이미 저장한 리뷰(같은 사진 URL 또는 같은 사진)는 건너뜀
+
+    listing_token: chord 없이 실행된 estimate_reviews()의 id, 그 마지막 chunk의 save_result()가
+                   finalize_reviews() 대신 상품의 리뷰 스크레이핑 시각과 리뷰 목록 진행 상태(listing) 기록
     """
     # import the modules that require the pipenv environment
     import uuid
-    import pickle
-    import tempfile
     import django
+    from django.db.models import Q
     from django.core.files import File
+    from recommender.betas import pack_betas
+    from recommender import metrics
+    from recommender.body_shape_index import add_reviews_to_index
+    from recommender.estimations import (
+        PREFILTER_REJECTIONS,
+        record_estimation,
+        record_rejection,
+    )
     from recommender.models import Good, Review
+    from recommender.ranking_cache import invalidate_good
+    from scraper.spool import release, save_spooled_image
 
     # load the django settings
     django.setup()
@@ -154,12 +337,39 @@ def save_result(reviews_mesh_obj, product_id):
             f"trying to save reviews of good with id {product_id}, which does not exist."
         )
 
+    # reviews of this good already stored, by a previous scrape or a chain enqueued twice
+    stored = Review.objects.filter(good=good).filter(
+        Q(source_url__in=[data.get("source_url") for data in reviews_mesh_obj if data.get("source_url")])
+        | Q(image_hash__in=[data["image_hash"] for data in reviews_mesh_obj])
+    )
+    stored_urls = set()
+    stored_hashes = set()
+    for source_url, image_hash in stored.values_list("source_url", "image_hash"):
+        stored_urls.add(source_url)
+        stored_hashes.add(image_hash)
+
+    # rejection reasons of the images estimated for the first time (None if accepted), to tune max_photos
+    prefilter_reasons = []
+
     # save the image content and the result content to the database
+    saved_reviews = []
     for data in reviews_mesh_obj:
-        if "betas" not in data or "meshed_image" not in data:
-            # remove temporary file 'review image' if body shape estimation failed
-            if os.path.exists(data["image"]):
-                os.remove(data["image"])
+        if data.get("source_url") in stored_urls or data["image_hash"] in stored_hashes:
+            continue
+
+        if data.get("betas") is None:
+            # body shape estimation failed, the spooled review image is released below
+            if data.get("reused", False):
+                continue
+            reason = data.get("rejected")
+            if reason in PREFILTER_REJECTIONS:
+                # not an estimation failure: the same photo uploaded by a client is estimated
+                # refresh_reviews() and scrape_reviews() skip it by source_url / image_hash
+                if record_rejection(data["image_hash"], reason, good.id, data.get("source_url")):
+                    prefilter_reasons.append(reason)
+            else:
+                record_estimation(data["image_hash"], None)
+                prefilter_reasons.append(reason)
             continue
 
         review = Review()
@@ -169,37 +379,267 @@ def save_result(reviews_mesh_obj, product_id):
         review.gender = data["gender"]
         review.height = data["height"]
         review.weight = data["weight"]
+        review.image_hash = data["image_hash"]
+        review.source_url = data.get("source_url", "")
 
-        with open(data["image"], "rb") as f:
-            review.image.save(str(uuid.uuid4()) + ".jpg", File(f))
+        # save the betas list as packed float32 in the betas column
+        review.betas = pack_betas(data["betas"])
 
-        # save the betas list as a pickle file and have inferred_model reference it
-        # open a temporary file in write binary mode
-        with tempfile.NamedTemporaryFile() as tmp:
-            # dump the betas list to the temporary file
-            pickle.dump(data["betas"], tmp)
-            # assign the temporary file to the inferred_model field, without specifying the path or name
-            review.inferred_model.save(str(uuid.uuid4()) + ".pkl", File(tmp))
+        # hard link the spooled review image into media/ instead of copying it
+        save_spooled_image(review.image, data["image"])
+        if data.get("overlayed_image") is not None:
+            # overlay rendered before for the same image, shared without copying
+            review.overlayed_image.name = data["overlayed_image"]
+        review.save()
 
-        with open(data["meshed_image"], "rb") as f:
-            review.overlayed_image.save(str(uuid.uuid4()) + ".jpg", File(f))
+        if data.get("meshed_image") is not None:
+            with open(data["meshed_image"], "rb") as f:
+                review.overlayed_image.save(str(uuid.uuid4()) + ".jpg", File(f))
+            if os.path.exists(data["meshed_image"]):
+                os.remove(data["meshed_image"])
 
-        # remove temporary files: review image, meshed image
-        if os.path.exists(data["image"]):
-            os.remove(data["image"])
-        if os.path.exists(data["meshed_image"]):
-            os.remove(data["meshed_image"])
+        if not data.get("reused", False):
+            record_estimation(review.image_hash, review.betas, review.overlayed_image.name)
+            prefilter_reasons.append(None)
 
+        saved_reviews.append(review)
+        stored_hashes.add(review.image_hash)
 
-@app.task(queue="estimate")
-def estimate_mesh_image(image):
+    metrics.record_prefilter(prefilter_reasons)
+
+    # release the spool references of this chain, other chains keep their own
+    for data in reviews_mesh_obj:
+        release(data["image"])
+
+    # ranking results of this good no longer include every review
+    invalidate_good(product_id)
+    add_reviews_to_index(saved_reviews)
+
+    if listing_token is not None and finish_listing_chunk(product_id, listing_token):
+        record_reviews_refreshed(product_id, listing)
+
+    if RENDER_IN_BACKGROUND:
+        # render 큐에서 overlayed_image를 미리 렌더링
+        for review in saved_reviews:
+            chain(
+                render_mesh.s(review.image.path, prefilter=True) | save_review.s(review.id)
+            ).delay()
+
+    return [review.id for review in saved_reviews]
+
+
+@app.task(queue="scrape")
+def estimate_reviews(reviews_obj, product_id, listing=None):
+    """
+    scrape_reviews()의 결과를 ESTIMATE_CHUNK_SIZE개씩 나눠 chunk마다 estimate_mesh | save_result를 병렬로 실행
+    estimate 워커가 여러 개면 chunk가 나눠서 처리되고, 한 chunk가 실패해도 다른 chunk의 결과는 저장됨
+    모든 chunk가 끝나면 finalize_reviews()가 결과를 모음 (CHORD_SUPPORTED일 때, 아니면 마지막으로 저장된 chunk의 save_result())
+    chunk가 하나라도 실패하면 리뷰 목록 진행 상태를 기록하지 않으므로 다음 refresh가 같은 범위를 다시 읽음
+
+    listing: 저장 후 상품에 기록할 리뷰 목록 진행 상태 (refresh_reviews()의 high-water mark / resume 범위)
+    """
+    chunks = [
+        reviews_obj[i : i + ESTIMATE_CHUNK_SIZE]
+        for i in range(0, len(reviews_obj), ESTIMATE_CHUNK_SIZE)
+    ]
+    if len(chunks) == 0:
+        return finalize_reviews([], product_id, listing)
+
+    if CHORD_SUPPORTED:
+        chunk_tasks = group(
+            chain(estimate_mesh.s(chunk) | save_result.s(product_id)) for chunk in chunks
+        )
+        chord(chunk_tasks)(finalize_reviews.s(product_id, listing))
+    else:
+        # without chord nothing runs after every chunk: each save_result() counts its chunk down on the good
+        # and the last one records the listing state, a chunk that fails leaves the listing state as it was
+        listing_token = start_listing_chunks(product_id, len(chunks))
+        chunk_tasks = group(
+            chain(
+                estimate_mesh.s(chunk)
+                | save_result.s(product_id, listing_token=listing_token, listing=listing)
+            )
+            for chunk in chunks
+        )
+        chunk_tasks.delay()
+    print(f"estimate_reviews {product_id}: {len(reviews_obj)} reviews in {len(chunks)} chunks")
+    return len(chunks)
+
+
+@app.task(queue="scrape")
+def finalize_reviews(saved_ids_per_chunk, product_id, listing=None):
+    """
+    estimate_reviews()의 모든 chunk가 저장된 뒤 실행, 상품의 리뷰 스크레이핑 시각과 리뷰 목록 진행 상태 기록
+
+    return: 저장된 리뷰 수
+    """
+    record_reviews_refreshed(product_id, listing)
+
+    saved = sum(len(ids) for ids in saved_ids_per_chunk)
+    print(f"finalize_reviews {product_id}: saved {saved} reviews")
+    return saved
+
+
+def start_listing_chunks(product_id, num_chunks):
+    """
+    chord 없이 실행되는 estimate_reviews()의 chunk 수를 상품에 기록하고 그 id(listing_token) 반환
+    이전 estimate_reviews()의 chunk가 아직 남아 있어도 이후로는 세지 않음
+    """
+    import uuid
+    import django
+    from recommender.models import Good
+
+    django.setup()
+    listing_token = uuid.uuid4().hex
+    Good.objects.filter(id=product_id).update(
+        review_listing_token=listing_token, review_chunks_pending=num_chunks
+    )
+    return listing_token
+
+
+def finish_listing_chunk(product_id, listing_token):
+    """
+    listing_token의 chunk 하나가 저장됨, 마지막 chunk면 True
+    상품에 다른 estimate_reviews()가 기록됐으면 False
+    """
+    import django
+    from django.db import transaction
+    from recommender.models import Good
+
+    django.setup()
+    with transaction.atomic():
+        good = (
+            Good.objects.select_for_update()
+            .filter(id=product_id, review_listing_token=listing_token)
+            .first()
+        )
+        if good is None or good.review_chunks_pending <= 0:
+            return False
+        good.review_chunks_pending -= 1
+        good.save(update_fields=["review_chunks_pending"])
+        return good.review_chunks_pending == 0
+
+
+def record_reviews_refreshed(product_id, listing=None):
+    """
+    상품의 리뷰 스크레이핑 시각과 리뷰 목록 진행 상태(refresh_reviews()의 listing) 기록
+    estimate_reviews()마다 한 번: finalize_reviews(), chord가 없으면 마지막으로 저장된 chunk의 save_result()
+    """
+    import django
+    from django.utils import timezone
+    from recommender.models import Good
+
+    django.setup()
+    Good.objects.filter(id=product_id).update(
+        reviews_refreshed_at=timezone.now(), **(listing or {})
+    )
+
+
+def enqueue_refresh(good_id):
+    """
+    상품의 새 리뷰만 스크레이핑, 추정, 저장하는 task를 큐에 넣음
+    """
+    return refresh_reviews.delay(good_id)
+
+
+@app.task(queue="scrape")
+def refresh_reviews(good_id, max_photos=REVIEW_REFRESH_MAX_PHOTOS):
     """
-                load MultiPerson model
+    이미 저장한 상품의 새 리뷰만 스크레이핑해 estimate_reviews()로 추정, 저장
+    최신순 목록을 high-water mark(이전에 끝까지 읽은 목록의 가장 최신 리뷰)까지만 읽고, 이미 저장한 리뷰의 사진은 받지 않음
+    max_photos에서 멈추면 high-water mark는 그대로 두고, 읽은 범위를 resume 범위로 기록해 다음 refresh가 건너뜀
+
+    return: estimate_reviews()와 같음
+    """
+    import django
+    from recommender.models import Good, PrefilterRejection, Review
+    from scraper.scraper import SORT_NEW
+
+    django.setup()
+    try:
+        good = Good.objects.get(id=good_id)
+    except Good.DoesNotExist:
+        raise ValueError(
+            f"trying to refresh reviews of good with id {good_id}, which does not exist."
+        )
+
+    # reviews already stored and review photos rejected by the pre-filter are not downloaded again
+    skip_urls = list(
+        Review.objects.filter(good=good).exclude(source_url="").values_list("source_url", flat=True)
+    )
+    skip_urls += PrefilterRejection.objects.filter(good=good).exclude(source_url="").values_list(
+        "source_url", flat=True
+    )
+    skip_range = None
+    if good.review_resume_top and good.review_resume_at:
+        skip_range = (good.review_resume_top, good.review_resume_at)
+    reviews, progress = scrape_review_listing(
+        good_id,
+        max_photos=max_photos,
+        sort=SORT_NEW,
+        stop_at=good.review_high_water or None,
+        skip_urls=skip_urls,
+        skip_range=skip_range,
+    )
+
+    if progress["complete"]:
+        # read down to the mark: every review above the newest one is handled
+        listing = {
+            "review_high_water": progress["newest"] or good.review_high_water,
+            "review_resume_top": "",
+            "review_resume_at": "",
+        }
+    elif progress["newest"] is None:
+        # the first page was not a review list: nothing was read, the mark and the resume range stay
+        listing = {}
+    else:
+        # stopped at max_photos: reviews between the last one read and the mark are still unread
+        # the range read now contains the previous resume range unless the new reviews alone filled max_photos
+        listing = {
+            "review_resume_top": progress["newest"] or "",
+            "review_resume_at": progress["oldest"] or "",
+        }
+    return estimate_reviews(reviews, good_id, listing)
+
+
+@app.task(queue="scrape")
+def refresh_stale_goods(limit=REVIEW_REFRESH_BATCH):
+    """
+    celery beat으로 주기적으로 실행
+    리뷰를 REVIEW_REFRESH_SECONDS 넘게 스크레이핑하지 않은 상품을 오래된 순으로 limit개까지 refresh
+    """
+    import datetime
+    import django
+    from django.db.models import F, Q
+    from django.utils import timezone
+    from recommender.models import Good
+
+    django.setup()
+    now = timezone.now()
+    stale_before = now - datetime.timedelta(seconds=REVIEW_REFRESH_SECONDS)
+    good_ids = list(
+        Good.objects.filter(
+            Q(reviews_refreshed_at__isnull=True) | Q(reviews_refreshed_at__lt=stale_before)
+        )
+        .order_by(F("reviews_refreshed_at").asc(nulls_first=True))
+        .values_list("id", flat=True)[:limit]
+    )
+    # claim the goods so the next beat run does not enqueue them again while the chains run
+    Good.objects.filter(id__in=good_ids).update(reviews_refreshed_at=now)
+
+    for good_id in good_ids:
+        enqueue_refresh(good_id)
+    return good_ids
 
+
+@app.task(queue="estimate")
+def estimate_mesh_image(image, prefilter=False):
+    """
     유저 사진에 대해 mesh estimation 진행하고 그 결과를 리턴
 
     param:
         image:  # path
+        prefilter:  # True면 전신 사진이 아닌 사진을 거름 (리뷰 사진), 유저 사진은 사람이 없을 때만 실패
 
     return: # python dict
         {
@@ -208,29 +648,134 @@ def estimate_mesh_image(image):
         }
     """
 
-    from recommender.body_shape_estimator import BodyShapeEstimator
+    if not os.path.exists(image):
+        return None
+
+    bse = get_estimator()
+
+    est = bse.estimate(image, prefilter=prefilter)
+    if est is None:
+        return None
+    else:
+        return {"betas": est["betas"], "meshed_image": est["meshed_image"]}
+
+
+@app.task(queue="estimate")
+def estimate_betas_image(image, prefilter=False):
+    """
+    유저/리뷰 사진에 대해 체형 파라미터(betas)만 추정해 리턴
+    폴더 생성, joint/patch 저장, mesh 렌더링을 하지 않음
+
+    param:
+        image:  # path
+        prefilter:  # estimate_mesh_image()와 같음
+
+    return: # python dict
+        {
+            "betas": # python list (10,)
+            "meshed_image": None
+        }
+    """
+    if not os.path.exists(image):
+        return None
+
+    bse = get_estimator()
 
-    bse = BodyShapeEstimator()
+    est = bse.estimate(image, betas_only=True, prefilter=prefilter)
+    if est is None:
+        return None
+    else:
+        return {"betas": est["betas"], "meshed_image": None}
+
+
+@app.task(queue="render")
+def render_mesh(image, prefilter=False):
+    """
+    유저/리뷰 사진의 mesh를 렌더링해 원본 사진에 겹친 이미지를 만듦
+    betas 추정과 달리 필요할 때만(ReviewBodyShapeView 조회, RENDER_IN_BACKGROUND) 실행
+
+    param:
+        image:  # path
+        prefilter:  # estimate_mesh_image()와 같음
+
+    return: # python dict
+        {
+            "betas": # python list (10,)
+            "meshed_image": # path to mesh of given image
+        }
+    """
     if not os.path.exists(image):
         return None
 
-    est = bse.estimate(image)
+    bse = get_estimator()
+
+    est = bse.estimate(image, prefilter=prefilter)
     if est is None:
         return None
     else:
         return {"betas": est["betas"], "meshed_image": est["meshed_image"]}
 
 
+@app.task(queue="scrape")
+def save_review(review_mesh_obj, review_id):
+    """
+    estimate_betas_image(), render_mesh()의 리턴값을 받아 기존 리뷰에 저장
+    """
+    import uuid
+    import django
+    from django.core.files import File
+    from recommender.betas import pack_betas
+    from recommender.body_shape_index import add_reviews_to_index
+    from recommender.estimations import record_estimation
+    from recommender.models import Review
+    from recommender.ranking_cache import invalidate_good
+
+    # load the django settings
+    django.setup()
+
+    try:
+        review = Review.objects.get(id=review_id)
+    except Review.DoesNotExist:
+        raise ValueError(
+            f"trying to save review with id {review_id}, which does not exist."
+        )
+    if review_mesh_obj is None:
+        # if body shape estimation failed
+        # 같은 사진은 렌더링도 실패하므로 ReviewBodyShapeView가 다시 렌더링을 요청하지 않도록 표시
+        # 실패 이유(pre-filter인지)를 알 수 없으므로 Estimation에는 기록하지 않음
+        review.overlay_failed = True
+        review.save(update_fields=["overlay_failed"])
+        return None
+
+    if review.betas is None:
+        review.betas = pack_betas(review_mesh_obj["betas"])
+        review.save(update_fields=["betas"])
+        invalidate_good(review.good_id)
+        add_reviews_to_index([review])
+
+    if review_mesh_obj.get("meshed_image") is not None:
+        with open(review_mesh_obj["meshed_image"], "rb") as f:
+            review.overlayed_image.save(str(uuid.uuid4()) + ".jpg", File(f))
+
+        # remove temporary file: meshed image
+        if os.path.exists(review_mesh_obj["meshed_image"]):
+            os.remove(review_mesh_obj["meshed_image"])
+
+    record_estimation(review.image_hash, review.betas, review.overlayed_image.name)
+
+    return 0
+
+
 @app.task(queue="scrape")
 def save_client(user_mesh_obj, client_id):
     """
-    estimate_mesh_image()의 리턴값을 받아 DB에 저장
+    estimate_mesh_image(), estimate_betas_image(), render_mesh()의 리턴값을 받아 DB에 저장
     """
     import uuid
-    import pickle
-    import tempfile
     import django
     from django.core.files import File
+    from recommender.betas import pack_betas
+    from recommender.estimations import record_estimation
     from recommender.models import Client
 
     # load the django settings
@@ -244,19 +789,31 @@ def save_client(user_mesh_obj, client_id):
         )
     if user_mesh_obj is None:
         # if body shape estimation failed
+        # 같은 사진은 렌더링도 실패하므로 ReviewBodyShapeView가 다시 렌더링을 요청하지 않도록 표시
+        client.overlay_failed = True
+        update_fields = ["overlay_failed"]
+        if client.betas is None:
+            client.estimation_status = Client.ESTIMATION_FAILED
+            update_fields.append("estimation_status")
+            record_estimation(client.image_hash, None)
+        client.save(update_fields=update_fields)
         return None
 
-    with tempfile.NamedTemporaryFile() as tmp:
-        # dump the betas list to the temporary file
-        pickle.dump(user_mesh_obj["betas"], tmp)
-        # assign the temporary file to the inferred_model field, without specifying the path or name
-        client.inferred_model.save(str(uuid.uuid4()) + ".pkl", File(tmp))
+    # render_mesh()의 betas로 ranking에 쓰이는 betas를 덮어쓰지 않음
+    if client.betas is None:
+        client.betas = pack_betas(user_mesh_obj["betas"])
+        client.estimation_status = Client.ESTIMATION_DONE
+        client.save(update_fields=["betas", "estimation_status"])
+
+    # estimate_betas_image()의 결과에는 meshed_image가 없음
+    if user_mesh_obj.get("meshed_image") is not None:
+        with open(user_mesh_obj["meshed_image"], "rb") as f:
+            client.overlayed_image.save(str(uuid.uuid4()) + ".jpg", File(f))
 
-    with open(user_mesh_obj["meshed_image"], "rb") as f:
-        client.overlayed_image.save(str(uuid.uuid4()) + ".jpg", File(f))
+        # remove temporary file: meshed image
+        if os.path.exists(user_mesh_obj["meshed_image"]):
+            os.remove(user_mesh_obj["meshed_image"])
 
-    # remove temporary file: meshed image
-    if os.path.exists(user_mesh_obj["meshed_image"]):
-        os.remove(user_mesh_obj["meshed_image"])
+    record_estimation(client.image_hash, client.betas, client.overlayed_image.name)
 
     return 0
@@ -1,3 +1,92 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+
+from recommender.betas import pack_betas
+from recommender.body_shape_index import (
+    BodyShapeIndex,
+    append_segment,
+    current_version,
+    segment_names,
+)
+from recommender.ranking import betas_matrix, cosine_distances, next_page
+
+
+class NextPageTest(SimpleTestCase):
+    def walk(self, ids, distances, page_size):
+        """
+        follow the (distance, id) cursor of the last review of each page, as BodyShapeCursorPagination does
+        """
+        pages = []
+        after = None
+        while True:
+            page, has_more = next_page(ids, distances, page_size, after)
+            pages.append([int(ids[i]) for i in page])
+            if not has_more:
+                return pages
+            last = page[-1]
+            # the cursor goes through a string, as in encode_cursor() / decode_cursor()
+            after = (float(repr(float(distances[last]))), int(ids[last]))
+
+    def test_walk_with_ties_and_missing_betas(self):
+        rng = np.random.default_rng(0)
+        blobs = []
+        for i in range(23):
+            if i % 5 == 0:
+                blobs.append(None)  # missing betas
+            elif i % 3 == 0:
+                blobs.append(pack_betas(np.ones(10)))  # ties
+            else:
+                blobs.append(pack_betas(rng.normal(size=10)))
+        ids = np.arange(100, 123)[::-1].copy()  # ids not in the order of the rows
+        matrix, valid = betas_matrix(blobs)
+        distances = cosine_distances(pack_betas(np.ones(10)), matrix, valid)
+
+        expected = [int(ids[i]) for i in np.lexsort((ids, distances))]
+        for page_size in (1, 3, 4, 23, 30):
+            pages = self.walk(ids, distances, page_size)
+            self.assertEqual(sum(pages, []), expected)
+            self.assertTrue(all(0 < len(page) <= page_size for page in pages))
+
+        # reviews without betas come after every review with betas
+        missing = {int(ids[i]) for i in np.flatnonzero(~valid)}
+        self.assertEqual(set(expected[-len(missing):]), missing)
+
+    def test_missing_betas_after_opposite_body_shape(self):
+        matrix, valid = betas_matrix([None, pack_betas(-np.ones(10))])
+        distances = cosine_distances(pack_betas(np.ones(10)), matrix, valid)
+        page, has_more = next_page(np.array([1, 2]), distances, 2)
+        self.assertEqual(page.tolist(), [1, 0])
+        self.assertFalse(has_more)
+
+
+class BodyShapeIndexSegmentTest(SimpleTestCase):
+    def test_segments_match_full_rewrite(self):
+        rng = np.random.default_rng(0)
+        betas = rng.normal(size=(12, 10)).astype(np.float32)
+        genders = ["M", "F"] * 6
+        heights = np.linspace(150, 190, 12)
+        goods = [1, 2, 3] * 4
+
+        def rows(s):
+            return np.arange(12)[s], betas[s], genders[s], heights[s], goods[s]
+
+        with tempfile.TemporaryDirectory() as path:
+            BodyShapeIndex.build(*rows(slice(0, 6))).save(path)
+            append_segment(path, *rows(slice(6, 9)))
+            append_segment(path, *rows(slice(9, 12)))
+            # a review estimated again replaces its previous row
+            betas[2] = -betas[2]
+            append_segment(path, *rows(slice(2, 3)))
+            self.assertEqual(len(segment_names(path, current_version(path))), 3)
+
+            segmented = BodyShapeIndex.load(path)
+            full = BodyShapeIndex.build(*rows(slice(0, 12)))
+            self.assertEqual(len(segmented), 12)
+            for query in rng.normal(size=(5, 10)):
+                for filters in ({}, {"gender": "F"}, {"good_id": 2}):
+                    ids, distances = segmented.search(query, k=4, **filters)
+                    expected_ids, expected_distances = full.search(query, k=4, **filters)
+                    self.assertEqual(ids.tolist(), expected_ids.tolist())
+                    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
@@ -5,7 +5,15 @@ urlpatterns = [
     path(
         "goods/<int:good_id>", views.GoodView.as_view(), name="good_detail"
     ),  # 상품 scrape, 상품 정보 반환
-    path("clients", views.ClientView.as_view(), name="client_list"), # 유저 저장, 유저 ID 반환
+    path("clients", views.ClientView.as_view(), name="client_list"), # 유저 저장, 유저 ID 반환 (체형 추정은 비동기)
+    path(
+        "clients/<int:client_id>", views.ClientStatusView.as_view(), name="client_detail"
+    ),  # 유저 체형 추정 진행 상태
+    path(
+        "clients/<int:client_id>/similar_reviews",
+        views.SimilarReviewListView.as_view(),
+        name="client_similar_reviews",
+    ),  # 전체 상품에서 유저와 체형이 비슷한 리뷰 목록, k, gender, min_height, max_height, good_id 파라미터 선택
     path(
         "goods/<int:good_id>/reviews", views.ReviewListView.as_view(), name="good_reviews"
     ),  # 상품에 대한 리뷰 목록(유사 체형순), user_id 파라미터 요구
@@ -14,6 +22,7 @@ urlpatterns = [
         views.ReviewBodyShapeView.as_view(),
         name="review_body_shapes",
     ),  # 리뷰에 대한 3D 모델 보기, user_id 파라미터로 요구
+    path("metrics", views.MetricsView.as_view(), name="metrics"), # 같은 사진의 체형 추정 결과 재사용 hit rate
     path(
         "testcelery/<int:product_id>", views.TestView.as_view()
     ),
@@ -1,14 +1,14 @@
 import io
 import os
-import pickle
-import tempfile
 import uuid
 
 import numpy as np
-from django.core.files import File
+from django.conf import settings
+from django.core.cache import caches
 from django.shortcuts import get_object_or_404
 from django.db.models import F, Value
 from django.db.models.functions import Abs
+from django.utils import timezone
 from rest_framework import generics
 from rest_framework import views
 from rest_framework.response import Response
@@ -16,19 +16,30 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
 
+from recommender.betas import unpack_betas
+from recommender.body_shape_index import get_index
+from recommender.estimations import hash_file, reuse_estimation, reuse_overlay
+from recommender import metrics
 from recommender.models import Brand, Good, Client, Review
+from recommender import ranking_cache
+from recommender.pagination import BodyShapeCursorPagination
+from recommender.ranking import betas_matrix, cosine_distances
 from recommender.serializers import (
     ClientImageSerializer,
     GoodSerializer,
     ReviewImageSerializer,
     ReviewSerializer,
+    SimilarReviewSerializer,
 )
 
 from recommender.tasks import (
-    estimate_mesh,
+    enqueue_refresh,
+    estimate_betas_image,
+    estimate_reviews,
     estimate_mesh_image,
+    render_mesh,
     save_client,
-    save_result,
+    save_review,
     scrape_reviews,
 )
 from celery import chain
@@ -63,30 +74,61 @@ class GoodView(generics.GenericAPIView):
     lookup_url_kwarg = "good_id"
 
     def get(self, request, good_id):
+        good = Good.objects.select_related("brand").filter(id=good_id).first()
+        if good is not None and is_fresh(good):
+            # 최근에 스크레이핑한 상품은 DB에서 바로 응답
+            serializer = self.get_serializer(good)
+            return Response(serializer.data)
+
         good_data = scrape_item(good_id)
         if good_data is None:
+            if good is not None:
+                # 갱신에 실패해도 저장된 상품정보로 응답
+                serializer = self.get_serializer(good)
+                return Response(serializer.data)
             return Response(
                 f"failed to scrape good with id {good_id}",
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        try:
-            good = Good.objects.get(id=good_id)
-        except Good.DoesNotExist:
-            good = Good(id=good_id, brand=good_data["brand"], name=good_data["name"])
+        if good is None:
+            good = Good(
+                id=good_id,
+                brand=good_data["brand"],
+                name=good_data["name"],
+                scraped_at=timezone.now(),
+            )
             good.image.save(str(uuid.uuid4()) + ".jpg", good_data["image"])
             good_data["image"].close()  # close the BytesIO object
 
             chain(
-                scrape_reviews.s(good_id, max_photos=10)
-                | estimate_mesh.s()
-                | save_result.s(good_id)
+                scrape_reviews.s(good_id, max_photos=10) | estimate_reviews.s(good_id)
             ).delay()
+        else:
+            # 오래된 상품정보 갱신
+            good.brand = good_data["brand"]
+            good.name = good_data["name"]
+            good.scraped_at = timezone.now()
+            good.save(update_fields=["brand", "name", "scraped_at"])
+            good_data["image"].close()
+
+            # 새 리뷰만 스크레이핑
+            enqueue_refresh(good_id)
 
         serializer = self.get_serializer(good)
         return Response(serializer.data)
 
 
+def is_fresh(good: Good) -> bool:
+    """
+    GOOD_REFRESH_SECONDS 안에 스크레이핑한 상품인지
+    """
+    if good.scraped_at is None:
+        return False
+    age = timezone.now() - good.scraped_at
+    return age.total_seconds() < settings.GOOD_REFRESH_SECONDS
+
+
 class ClientView(views.APIView):
     parser_classes = (MultiPartParser, FormParser)
 
@@ -100,103 +142,133 @@ class ClientView(views.APIView):
             gender=gender,
             height=height,
             image=image,
+            image_hash=hash_file(image),
         )
 
-        successful, client = estimate_client(client)
-        if not successful:
-            try:
-                client.delete()
-            except Exception as e:
-                print(f"failed to delete client {client}")
-                return Response(
-                    "person not found in provided image. failed to delete client",
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
-            return Response(
-                {
-                    "is_valid": False,
-                    "invalid_reason": "person not found in provided image",
-                    "id": None,
-                    "bounding_box": None # not used
-                }
-            )
-        else:
-            return Response(
-                {
-                    "is_valid": True,  # 플로우에서 불필요해 하드코딩
-                    "invalid_reason": None,  # 플로우에서 불필요해 하드코딩
-                    "id": client.id,
-                    "bounding_box": None,  # 플로우에서 불필요해 하드코딩
-                }
-            )
+        # 같은 사진을 추정한 적이 있으면 결과를 재사용
+        # 아니면 체형 추정은 estimate 큐에서 진행, 결과는 GET /clients/<id>로 확인
+        job = None if reuse_estimation(client) else estimate_client(client)
+        return Response(
+            {
+                **client_status_data(client),
+                "job_id": None if job is None else job.id,
+                "bounding_box": None,  # 플로우에서 불필요해 하드코딩
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
 
 
-def estimate_client(client: Client):
-    success = False
-    if not client.inferred_model or not client.overlayed_image:
-        img_path = client.image.path
-        result = (
-            chain(estimate_mesh_image.s(img_path) | save_client.s(client.id))
-            .delay()
-            .get()
-        )
-        success = False if result is None else True
-    else:
-        success = True
-
-    client = Client.objects.get(id=client.id)
-    return success, client
-
-
-def estimate_review(review: Review):
-    success = True
-    if not review.inferred_model or not review.overlayed_image:
-        img_path = review.image.path
-        result = estimate_mesh_image.s(img_path).delay().get()
-        success = False if result is None else True
-
-        # save betas
-        with tempfile.NamedTemporaryFile() as tmp:
-            pickle.dump(result["betas"], tmp)
-            review.inferred_model.save(str(uuid.uuid4()) + ".pkl", File(tmp))
-        # save mesh
-        with open(result["meshed_image"], "rb") as f:
-            review.overlayed_image.save(str(uuid.uuid4()) + ".jpg", File(f))
-        # remove temporary file: meshed image
-        if os.path.exists(result["meshed_image"]):
-            os.remove(result["meshed_image"])
+class ClientStatusView(views.APIView):
+    def get(self, request, client_id):
+        client = get_object_or_404(Client, id=client_id)
+        return Response(client_status_data(client))
+
+
+def client_status_data(client: Client):
+    """
+    client의 체형 추정 진행 상태. status: "pending" | "done" | "failed"
+    """
+    failed = client.estimation_status == Client.ESTIMATION_FAILED
+    done = client.estimation_status == Client.ESTIMATION_DONE
+    return {
+        "id": client.id,
+        "status": client.estimation_status,
+        "is_valid": True if done else (False if failed else None),
+        "invalid_reason": "person not found in provided image" if failed else None,
+    }
+
+
+def pending_client_response(client: Client):
+    """
+    client의 betas가 아직 없을 때의 응답: 추정 중이면 202, 추정에 실패했으면 409
+    """
+    if client.estimation_status == Client.ESTIMATION_FAILED:
+        return Response(client_status_data(client), status=status.HTTP_409_CONFLICT)
+
+    # 추정 task가 끝났거나 유실됐으면 다시 큐에 넣음 (이미 넣었으면 넣지 않음)
+    estimate_client(client)
+    return Response(client_status_data(client), status=status.HTTP_202_ACCEPTED)
+
+
+# a task enqueued for the same object is not enqueued again within this many seconds
+ESTIMATION_LOCK_TIMEOUT = 600
+
+
+def enqueue_once(key, signature):
+    """
+    signature를 큐에 넣고 AsyncResult 반환. key로 이미 넣은 task가 있으면 None 반환
+    """
+    # shared by every web server process, so a task is not enqueued once per process
+    cache = caches[settings.ESTIMATION_LOCK_CACHE]
+    if not cache.add(f"enqueued:{key}", True, timeout=ESTIMATION_LOCK_TIMEOUT):
+        return None
+    return signature.delay()
+
+
+def estimate_client(client: Client, with_mesh=False):
+    """
+    client의 betas가 없으면 추정 task를, with_mesh가 True면 render 큐의 mesh 렌더링(overlayed_image) task를 큐에 넣음
+    결과를 기다리지 않으며, 넣은 task의 AsyncResult(넣을 필요가 없거나 이미 넣었으면 None) 반환
+    """
+    if client.betas is None and client.estimation_status == Client.ESTIMATION_FAILED:
+        return None
+
+    if (
+        with_mesh
+        and not client.overlayed_image
+        and not client.overlay_failed
+        and not reuse_overlay(client)
+    ):
+        estimate_task = render_mesh  # betas도 함께 저장됨
+    elif client.betas is None:
+        estimate_task = estimate_betas_image
     else:
-        success = True
+        return None
 
-    review = Review.objects.get(id=review.id)
-    return success, review
+    return enqueue_once(
+        f"client:{client.id}:{estimate_task.name}",
+        chain(estimate_task.s(client.image.path) | save_client.s(client.id)),
+    )
 
 
-def get_body_shape_difference(client: Client, review: Review):
-    success, client = estimate_client(client)
-    if not success:
-        return 1.0
+def estimate_review(review: Review, with_mesh=False):
+    """
+    review의 betas가 없으면 추정 task를, with_mesh가 True면 render 큐의 mesh 렌더링(overlayed_image) task를 큐에 넣음
+    결과를 기다리지 않으며, 넣은 task의 AsyncResult(넣을 필요가 없거나 이미 넣었으면 None) 반환
+    """
+    # 추정에 실패한 리뷰(save_review가 overlay_failed로 표시)는 다시 추정하지 않음
+    if review.betas is None and review.overlay_failed:
+        return None
 
-    success, review = estimate_review(review)
-    if not success:
-        return 1.0
+    if (
+        with_mesh
+        and not review.overlayed_image
+        and not review.overlay_failed
+        and not reuse_overlay(review)
+    ):
+        estimate_task = render_mesh  # betas도 함께 저장됨
+    elif review.betas is None:
+        estimate_task = estimate_betas_image
+    else:
+        return None
+
+    return enqueue_once(
+        f"review:{review.id}:{estimate_task.name}",
+        # 리뷰 사진만 전신 사진이 아니면 거름 (pre-filter)
+        chain(estimate_task.s(review.image.path, prefilter=True) | save_review.s(review.id)),
+    )
 
-    # get user and reviewer betas, stored as a pkl file
-    # store the betas in a python list
-    client_betas = []
-    review_betas = []
 
-    with open(client.inferred_model.path, "rb") as f:
-        client_betas = pickle.load(f)
-        assert type(client_betas) == type([]) and len(client_betas) == 10
+def get_body_shape_difference(client: Client, review: Review):
+    # only precomputed betas are used
+    if client.betas is None or review.betas is None:
+        return 1.0
 
-    with open(review.inferred_model.path, "rb") as f:
-        review_betas = pickle.load(f)
-        assert type(review_betas) == type([]) and len(review_betas) == 10
+    # get user and reviewer betas, stored as packed float32 in the betas column
+    client_betas = unpack_betas(client.betas).astype(np.float64)
+    review_betas = unpack_betas(review.betas).astype(np.float64)
 
     # calculate the cosine distance between the two betas
-    client_betas, review_betas = np.array(client_betas), np.array(review_betas)
     cosine_distance = 1 - np.dot(client_betas, review_betas) / (
         np.linalg.norm(client_betas) * np.linalg.norm(review_betas)
     )
@@ -206,37 +278,121 @@ def get_body_shape_difference(client: Client, review: Review):
 class ReviewListView(generics.ListAPIView):
     queryset = Review
     serializer_class = ReviewSerializer
+    pagination_class = BodyShapeCursorPagination
     lookup_url_kwarg = "good_id"
 
     # get user using user_id found in the query parameter
     # respond with 400 BAD REQUEST if user_id is not provided, or if "Client" with id=user_id is not found in the database
     # filter queryset to only the one's with height difference lte 5
-    # for each review in queryset, call function get_body_shape_difference(client, review)
-    # this function returns a float. annotate each review with the returned value as "difference"
-    # once every object in the queryset is annotated, order the queryset as ascending order of difference
-    # return queryset
     def get_queryset(self):
         good_id = self.kwargs.get(self.lookup_url_kwarg)
         client_id = self.request.query_params.get("user_id")
         if not client_id:
             raise ValidationError("user_id is required")
-        client = get_object_or_404(Client, id=client_id)
+        self.client = get_object_or_404(Client, id=client_id)
         queryset = super().get_queryset().objects.filter(good_id=good_id)
         queryset = queryset.annotate(
-            height_diff=Abs(F("height") - Value(client.height))
+            height_diff=Abs(F("height") - Value(self.client.height))
         )
         queryset = queryset.filter(height_diff__lte=5)
+        return queryset
 
-        # order the queryest by body shape difference ascending
-        queryset = sorted(
-            queryset, key=lambda review: get_body_shape_difference(client, review)
-        )
+    # only precomputed betas are used, estimation is never waited for in the request
+    # load the betas of every review into one matrix, and compute the cosine distances to the user's betas at once
+    # respond with the page after the cursor, ordered as ascending order of difference
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        if self.client.betas is None:
+            return pending_client_response(self.client)
+
+        ids, distances = self.get_distances(queryset)
+        review_ids = self.paginator.paginate_ranking(ids, distances, request)
+
+        reviews = queryset.in_bulk(review_ids)
+        reviews = [reviews[i] for i in review_ids if i in reviews]
+        serializer = self.get_serializer(reviews, many=True)
+        return self.paginator.get_paginated_response(serializer.data)
+
+    def get_distances(self, queryset):
+        """
+        Output:
+         - ids: (n,) review ids
+         - distances: (n,) body shape difference of each review to the user
+        """
+        # repeated views and further pages of the same list are served from the ranking cache
+        good_id = self.kwargs.get(self.lookup_url_kwarg)
+        key = ranking_cache.ranking_key(self.client, good_id)
+        cached = ranking_cache.get_ranking(key)
+        if cached is not None:
+            return cached
 
-        # queryset = queryset.annotate(
-        #     difference=lambda review: get_body_shape_difference(client, review)
-        # )
-        # queryset = queryset.order_by("difference")
-        return queryset
+        # reviews saved without betas are estimated in the background and ranked last meanwhile
+        for review in queryset.filter(betas__isnull=True, overlay_failed=False):
+            estimate_review(review)
+
+        rows = list(queryset.values_list("id", "betas"))
+        ids = np.array([review_id for review_id, _ in rows], dtype=np.int64)
+        matrix, valid = betas_matrix([betas for _, betas in rows])
+        distances = cosine_distances(self.client.betas, matrix, valid)
+
+        ranking_cache.set_ranking(key, (ids, distances))
+        return ids, distances
+
+
+class SimilarReviewListView(generics.ListAPIView):
+    """
+    전체 상품의 리뷰 중 유저와 체형이 가장 비슷한 리뷰 k개
+    query parameters: k, gender, min_height, max_height, good_id (모두 선택)
+    """
+
+    serializer_class = SimilarReviewSerializer
+    lookup_url_kwarg = "client_id"
+    max_k = 100
+
+    def list(self, request, *args, **kwargs):
+        self.client = get_object_or_404(Client, id=self.kwargs.get(self.lookup_url_kwarg))
+        if self.client.betas is None:
+            return pending_client_response(self.client)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        client = self.client
+        params = self.request.query_params
+        try:
+            k = int(params.get("k", 20))
+            min_height = params.get("min_height")
+            min_height = None if min_height is None else float(min_height)
+            max_height = params.get("max_height")
+            max_height = None if max_height is None else float(max_height)
+            good_id = params.get("good_id")
+            good_id = None if good_id is None else int(good_id)
+        except ValueError:
+            raise ValidationError("k, min_height, max_height, good_id must be numbers")
+        if not 1 <= k <= self.max_k:
+            raise ValidationError(f"k must be between 1 and {self.max_k}")
+        gender = params.get("gender")
+        if gender is not None and gender not in dict(Client.GENDER_CHOICES):
+            raise ValidationError("gender must be one of M, F")
+
+        index = get_index()
+        if index is None:
+            return []
+
+        ids, distances = index.search(
+            unpack_betas(client.betas),
+            k=k,
+            gender=gender,
+            min_height=min_height,
+            max_height=max_height,
+            good_id=good_id,
+        )
+        reviews = Review.objects.in_bulk(ids.tolist())
+        similar = []
+        for review_id, distance in zip(ids.tolist(), distances.tolist()):
+            if review_id in reviews:
+                reviews[review_id].difference = distance
+                similar.append(reviews[review_id])
+        return similar
 
 
 class ReviewBodyShapeView(generics.RetrieveAPIView):
@@ -251,20 +407,25 @@ class ReviewBodyShapeView(generics.RetrieveAPIView):
         review = get_object_or_404(Review, id=review_id)
         client = get_object_or_404(Client, id=user_id)
 
-        success, client = estimate_client(client)
-        if not success:
+        if client.betas is None and client.estimation_status == Client.ESTIMATION_FAILED:
             return Response(
                 "failed to estimate or render mesh of client",
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        success, review = estimate_review(review)
-        if not success:
+        if client.overlay_failed or review.overlay_failed:
             return Response(
-                "failed to estimate or render mesh of client",
+                "failed to render mesh of "
+                + ("client" if client.overlay_failed else "review"),
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+        # overlay가 없으면 render 큐에 넣고 202 응답, 클라이언트는 같은 URL을 다시 조회
+        estimate_client(client, with_mesh=True)
+        estimate_review(review, with_mesh=True)
+        if not client.overlayed_image or not review.overlayed_image:
+            return Response({"status": "rendering"}, status=status.HTTP_202_ACCEPTED)
+
         review_images = ReviewImageSerializer(review, context={"request": request}).data
         client_images = ClientImageSerializer(client, context={"request": request}).data
 
@@ -273,6 +434,13 @@ class ReviewBodyShapeView(generics.RetrieveAPIView):
         return Response(data)
 
 
+class MetricsView(views.APIView):
+    def get(self, request):
+        return Response(
+            {"dedup": metrics.dedup_stats(), "prefilter": metrics.prefilter_stats()}
+        )
+
+
 class TestView(views.APIView):
     def get(self, request, product_id):
         # implement complete in GoodsView.
@@ -281,8 +449,7 @@ class TestView(views.APIView):
             scrape_reviews.s(
                 product_id, max_photos=3
             ),  # TODO: try setting max_photos to larger number
-            estimate_mesh.s(),
-            save_result.s(product_id),
+            estimate_reviews.s(product_id),
         ).delay()
 
         # return a success response
@@ -308,12 +475,8 @@ class TestView(views.APIView):
                 id=product_id, gender="M", height=170, image=image
             )
 
-        # chain(estimate_mesh_image.s(full_img_path) | save_client.s(client.id)).delay()
-        result = (
-            chain(estimate_mesh_image.s(img_path) | save_client.s(client.id))
-            .delay()
-            .get()
-        )
-        # do something with result
+        result = chain(
+            estimate_mesh_image.s(img_path) | save_client.s(client.id)
+        ).delay()
 
-        return Response(f"done with {result}")
+        return Response({"message": "Tasks sent to the queue", "job_id": result.id})
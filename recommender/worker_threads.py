@@ -0,0 +1,125 @@
+"""
+CPU 전용 estimate/render 워커의 스레드 수와 CPU 코어 배정
+
+워커 하나에 prefork 프로세스가 -c(--concurrency)개 뜨고, 각 프로세스의 torch/OpenCV가 기본값으로
+코어 수만큼 스레드를 만들면 코어 수 x 프로세스 수의 스레드가 경쟁한다(oversubscription).
+configure_threads()는 worker_process_init에서 모델을 로드하기 전에 호출되어
+코어를 프로세스 수로 나눠 각 프로세스의 스레드 수를 정하고, 원하면 그 코어에 프로세스를 고정한다.
+
+torch, cv2는 configure_threads() 안에서 import 하므로 pipenv 환경에서도 이 모듈은 import 할 수 있다.
+"""
+import os
+
+# 프로세스당 torch intra-op 스레드 수, 0이면 (사용 가능한 코어 수 / 프로세스 수)
+ESTIMATOR_NUM_THREADS = int(os.getenv("ESTIMATOR_NUM_THREADS", "0"))
+# 프로세스당 torch inter-op 스레드 수, 네트워크를 순서대로 실행하므로 1이면 충분
+ESTIMATOR_INTEROP_THREADS = int(os.getenv("ESTIMATOR_INTEROP_THREADS", "1"))
+# 1이면 각 프로세스를 겹치지 않는 코어 묶음에 고정 (os.sched_setaffinity, Linux)
+ESTIMATOR_PIN_CPUS = os.getenv("ESTIMATOR_PIN_CPUS", "0") == "1"
+
+# configure_threads()로 이 프로세스에 적용된 설정
+_applied = None
+
+
+def available_cpus():
+    """
+    CPU ids this process may run on (cgroup / taskset restrictions included)
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_threads(
+    num_processes,
+    process_index,
+    num_threads=ESTIMATOR_NUM_THREADS,
+    cpus=None,
+):
+    """
+    Split the CPUs into num_processes contiguous blocks, one per pool process.
+
+    Input:
+     - num_processes: number of model processes of the worker (celery --concurrency)
+     - process_index: index of this process in the pool, 0 .. num_processes - 1
+     - num_threads: intra-op threads per process (0: size of the block of the process)
+     - cpus: CPU ids to split (Optional: if None, available_cpus())
+    Output:
+     - (threads, block): intra-op thread count and CPU ids of the block of this process
+    """
+    cpus = available_cpus() if cpus is None else list(cpus)
+    num_processes = max(1, num_processes)
+    if num_processes >= len(cpus):
+        # more processes than cores: one core each, shared round robin
+        block = [cpus[process_index % len(cpus)]]
+    else:
+        # the first len(cpus) % num_processes blocks get one more core
+        per_process, extra = divmod(len(cpus), num_processes)
+        index = process_index % num_processes
+        start = index * per_process + min(index, extra)
+        block = cpus[start : start + per_process + (1 if index < extra else 0)]
+
+    threads = num_threads if num_threads > 0 else len(block)
+    return threads, block
+
+
+def configure_threads(
+    num_processes,
+    process_index,
+    num_threads=ESTIMATOR_NUM_THREADS,
+    interop_threads=ESTIMATOR_INTEROP_THREADS,
+    pin_cpus=ESTIMATOR_PIN_CPUS,
+):
+    """
+    Apply the thread plan of this process to OpenMP / MKL, torch and OpenCV, and optionally pin the process.
+    Must run before torch is imported for OMP_NUM_THREADS / MKL_NUM_THREADS to take effect.
+
+    Input:
+     - num_processes, process_index, num_threads: see plan_threads()
+     - interop_threads: torch inter-op threads (0: torch default)
+     - pin_cpus: restrict the process to its block of CPUs
+    Output:
+     - {"threads": int, "interop_threads": int | None, "cpus": list | None} applied to this process
+    """
+    global _applied
+
+    threads, block = plan_threads(num_processes, process_index, num_threads)
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(threads)
+
+    pinned = None
+    if pin_cpus:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, block)
+            pinned = block
+        else:
+            print("ESTIMATOR_PIN_CPUS is not supported on this platform")
+
+    import torch
+
+    torch.set_num_threads(threads)
+    applied_interop = None
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+            applied_interop = interop_threads
+        except RuntimeError as e:
+            # inter-op pool already started in this process
+            print(f"failed to set torch inter-op threads: {e}")
+
+    try:
+        import cv2
+
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+    _applied = {"threads": threads, "interop_threads": applied_interop, "cpus": pinned}
+    return dict(_applied)
+
+
+def thread_config():
+    """
+    configure_threads()로 적용된 설정, 적용 전이면 None
+    """
+    return dict(_applied) if _applied is not None else None
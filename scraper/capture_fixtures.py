@@ -0,0 +1,45 @@
+"""
+scraper 테스트(scraper/tests.py)에 쓰는 무신사 응답을 scraper/fixtures에 저장
+
+python -m scraper.capture_fixtures <product_id> [--pages 2] [--sort new]
+
+- item_<product_id>.html: 상품 페이지 (사이즈표)
+- review_list_<product_id>_<sort>_<page>.html: 리뷰 목록 페이지
+마크업이 바뀌면 다시 저장해 테스트가 실제 응답으로 이전 parser와 새 parser를 비교하도록 합니다.
+"""
+import argparse
+import os
+
+from scraper.client import get_client
+from scraper.scraper import ITEM_URL, SORT_NEW, SORT_POPULAR, fetch_review_list_page
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SORTS = {"new": SORT_NEW, "popular": SORT_POPULAR}
+
+
+def save(name, content):
+    path = os.path.join(FIXTURES_DIR, name)
+    with open(path, "wb") as f:
+        f.write(content)
+    print(f"saved {path} ({len(content)} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("product_id", type=int)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--sort", choices=SORTS, default="new")
+    args = parser.parse_args()
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    response = get_client().get(ITEM_URL + str(args.product_id))
+    response.raise_for_status()
+    save(f"item_{args.product_id}.html", response.content)
+
+    for page in range(1, args.pages + 1):
+        html = fetch_review_list_page(args.product_id, page, SORTS[args.sort])
+        save(f"review_list_{args.product_id}_{args.sort}_{page}.html", html)
+
+
+if __name__ == "__main__":
+    main()
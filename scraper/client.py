@@ -0,0 +1,277 @@
+import os
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from scraper.http_cache import HttpCache
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36 Edg/118.0.2088.76"
+}
+
+# (connect, read) timeout in seconds
+CONNECT_TIMEOUT = float(os.getenv("SCRAPER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("SCRAPER_READ_TIMEOUT", "20"))
+# retries on 429 / 5xx / connection errors, with exponential backoff starting at BACKOFF seconds
+MAX_RETRIES = int(os.getenv("SCRAPER_MAX_RETRIES", "3"))
+BACKOFF = float(os.getenv("SCRAPER_BACKOFF", "0.5"))
+MAX_BACKOFF = 30.0
+# per host token bucket: RATE_LIMIT requests per second on average, bursts up to RATE_BURST, 0 disables
+RATE_LIMIT = float(os.getenv("SCRAPER_RATE_LIMIT", "10"))
+# at least 1: a bucket holding less than one token never lets a request through
+RATE_BURST = max(1, int(os.getenv("SCRAPER_RATE_BURST", "10")))
+# keep-alive connections kept per host, matches the number of concurrent image downloads
+POOL_SIZE = int(os.getenv("SCRAPER_DOWNLOAD_CONCURRENCY", "8"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    thread safe token bucket, acquire() blocks until a token is available
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        take a token, return seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+def retry_after_seconds(response):
+    """
+    seconds requested by the Retry-After header, None if missing or malformed
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """
+    HTTP client shared by every Musinsa request of a scrape worker
+    - pooled keep-alive session
+    - per host token bucket rate limit
+    - exponential backoff on 429 / 5xx / connection errors, honoring Retry-After
+    - (connect, read) timeouts
+    - request metrics
+    """
+
+    def __init__(
+        self,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        max_retries=MAX_RETRIES,
+        backoff=BACKOFF,
+        rate_limit=RATE_LIMIT,
+        rate_burst=RATE_BURST,
+        pool_size=POOL_SIZE,
+        cache=None,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.cache = cache if cache is not None else HttpCache()
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.statuses = Counter()
+        self.seconds = Counter()
+
+    def bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate_limit, self.rate_burst)
+            return self.buckets[host]
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def backoff_seconds(self, attempt, response=None):
+        if response is not None:
+            retry_after = retry_after_seconds(response)
+            if retry_after is not None:
+                return min(retry_after, MAX_BACKOFF)
+        return min(self.backoff * 2**attempt, MAX_BACKOFF)
+
+    def get(self, url, **kwargs):
+        """
+        GET with rate limit and retries
+        return the last response (status may still be 429 / 5xx after the retries run out),
+        raise the last requests.RequestException if no response was received
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).netloc
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limit > 0:
+                waited = self.bucket(host).acquire()
+                if waited > 0:
+                    with self.lock:
+                        self.seconds["throttled"] += waited
+
+            self.count("requests")
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, **kwargs)
+            except requests.RequestException as e:
+                with self.lock:
+                    self.seconds["request"] += time.monotonic() - start
+                    self.counters["errors"] += 1
+                    if isinstance(e, requests.Timeout):
+                        self.counters["timeouts"] += 1
+                if attempt == self.max_retries:
+                    raise
+                print(f"request failed on url: {url}, retrying")
+                print(e, end="\n\n")
+                self.count("retries")
+                time.sleep(self.backoff_seconds(attempt))
+                continue
+
+            with self.lock:
+                self.seconds["request"] += time.monotonic() - start
+                self.statuses[response.status_code] += 1
+            if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                return response
+
+            print(f"request failed on url: {url}, response code: {response.status_code}, retrying")
+            self.count("retries")
+            time.sleep(self.backoff_seconds(attempt, response))
+
+    def get_cached(self, url, **kwargs):
+        """
+        GET through the disk http cache
+        - fresh entry: served without a request
+        - stale entry: revalidated with its ETag / Last-Modified, a 304 serves the cached body
+        - miss: normal GET, 200 responses are stored
+        """
+        cache_url = requests.Request("GET", url, params=kwargs.pop("params", None)).prepare().url
+        entry = self.cache.get(cache_url)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.count("cache_hits")
+            return cached_response(cache_url, entry)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            headers.update(entry.validators())
+        response = self.get(cache_url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self.count("cache_revalidated")
+            self.cache.touch(cache_url, entry)
+            return cached_response(cache_url, entry)
+
+        self.count("cache_misses")
+        if response.status_code == 200:
+            try:
+                self.cache.set(cache_url, response)
+            except OSError as e:
+                print(f"http cache write failed on url: {cache_url}")
+                print(e, end="\n\n")
+        return response
+
+    def metrics(self):
+        """
+        snapshot of the request metrics, cumulative since the client was created
+        per operation numbers: metrics_delta() of two snapshots
+        """
+        with self.lock:
+            return {
+                "requests": self.counters["requests"],
+                "retries": self.counters["retries"],
+                "errors": self.counters["errors"],
+                "timeouts": self.counters["timeouts"],
+                "cache_hits": self.counters["cache_hits"],
+                "cache_revalidated": self.counters["cache_revalidated"],
+                "cache_misses": self.counters["cache_misses"],
+                "status": dict(self.statuses),
+                "request_seconds": round(self.seconds["request"], 3),
+                "throttled_seconds": round(self.seconds["throttled"], 3),
+            }
+
+
+def metrics_delta(before, after):
+    """
+    request metrics between two HttpClient.metrics() snapshots
+    """
+    delta = {}
+    for name, value in after.items():
+        if name == "status":
+            delta[name] = {
+                code: count - before[name].get(code, 0)
+                for code, count in value.items()
+                if count != before[name].get(code, 0)
+            }
+        elif isinstance(value, float):
+            delta[name] = round(value - before[name], 3)
+        else:
+            delta[name] = value - before[name]
+    return delta
+
+
+def cached_response(url, entry):
+    """
+    requests.Response built from a cache entry
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = entry.body
+    response.headers = CaseInsensitiveDict(
+        {"Content-Type": entry.meta.get("content_type") or ""}
+    )
+    return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    process wide HttpClient, created on first use
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# disk cache of product pages and images
+HTTP_CACHE_DIR = os.getenv("SCRAPER_HTTP_CACHE_DIR") or os.path.join(BASE_DIR, "cache", "http")
+# entries younger than HTTP_CACHE_TTL seconds are served without a request,
+# older ones are revalidated with If-None-Match / If-Modified-Since
+HTTP_CACHE_TTL = float(os.getenv("SCRAPER_HTTP_CACHE_TTL", "3600"))
+# entries not fetched or revalidated for HTTP_CACHE_MAX_AGE seconds are deleted
+HTTP_CACHE_MAX_AGE = float(os.getenv("SCRAPER_HTTP_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+PRUNE_INTERVAL = 3600
+
+
+class CacheEntry:
+    def __init__(self, meta, body):
+        self.meta = meta
+        self.body = body
+
+    @property
+    def age(self):
+        return time.time() - self.meta["fetched_at"]
+
+    def validators(self):
+        """
+        conditional request headers for revalidating the entry
+        """
+        headers = {}
+        if self.meta.get("etag"):
+            headers["If-None-Match"] = self.meta["etag"]
+        if self.meta.get("last_modified"):
+            headers["If-Modified-Since"] = self.meta["last_modified"]
+        return headers
+
+
+class HttpCache:
+    """
+    url -> (body, ETag, Last-Modified, fetched_at) on disk, one body file and one json file per url
+    writes are atomic so scrape workers and the web server can share the directory
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, ttl=HTTP_CACHE_TTL, max_age=HTTP_CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_age = max_age
+        self.last_prune = 0.0
+
+    def path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, url):
+        """
+        return CacheEntry for url, None if not cached
+        """
+        path = self.path(url)
+        try:
+            with open(path + ".json") as f:
+                meta = json.load(f)
+            with open(path + ".body", "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if len(body) != meta.get("size"):
+            # body replaced by a concurrent write after the meta was read
+            return None
+        return CacheEntry(meta, body)
+
+    def is_fresh(self, entry):
+        return entry.age < self.ttl
+
+    def set(self, url, response):
+        """
+        store a 200 response
+        """
+        path = self.path(url)
+        meta = {
+            "url": url,
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type"),
+            "size": len(response.content),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(path + ".body", response.content)
+        self._write(path + ".json", json.dumps(meta).encode())
+        self.prune()
+
+    def touch(self, url, entry):
+        """
+        mark entry fresh again after a 304 Not Modified
+        """
+        path = self.path(url)
+        entry.meta["fetched_at"] = time.time()
+        self._write(path + ".json", json.dumps(entry.meta).encode())
+        try:
+            os.utime(path + ".body")  # keep the body from being pruned
+        except OSError:
+            pass
+
+    def _write(self, path, content):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def prune(self):
+        """
+        delete entries older than max_age, at most once per PRUNE_INTERVAL
+        """
+        now = time.time()
+        if now - self.last_prune < PRUNE_INTERVAL:
+            return
+        self.last_prune = now
+
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) > self.max_age:
+                        os.unlink(path)
+                except OSError:
+                    pass
@@ -0,0 +1,54 @@
+import os
+import re
+
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
+
+
+def _default_parser():
+    # lxml is several times faster than html.parser, fall back when it is not installed
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return "html.parser"
+    return "lxml"
+
+
+# BeautifulSoup tree builder used by the scraper ("lxml", "html.parser", ...)
+HTML_PARSER = os.getenv("SCRAPER_HTML_PARSER") or _default_parser()
+
+# partial parsing targets: only the matching elements (and their children) are built into the tree
+# the strainer sees the whole class attribute, so the class is matched as one of its space separated values
+REVIEW_LIST_ONLY = SoupStrainer("div", class_=re.compile(r"(^|\s)review-list-wrap(\s|$)"))
+SIZE_TABLE_ONLY = SoupStrainer("table", id="size_table")
+
+
+def make_soup(html, parse_only=None, parser=None):
+    """
+    parse html with the configured parser
+    parse_only: SoupStrainer limiting the tree to the elements the caller reads
+    """
+    parser = parser or HTML_PARSER
+    try:
+        return BeautifulSoup(html, parser, parse_only=parse_only)
+    except FeatureNotFound:
+        print(f"html parser {parser} not available, falling back to html.parser")
+        return BeautifulSoup(html, "html.parser", parse_only=parse_only)
+
+
+def find_review_list(html, parser=None):
+    """
+    return review-list divs of a review list page, None if the page has no review-list-wrap
+    """
+    soup = make_soup(html, REVIEW_LIST_ONLY, parser)
+    review_list_wrap = soup.find("div", "review-list-wrap")
+    if review_list_wrap is None:
+        return None
+    return review_list_wrap.find_all("div", "review-list")
+
+
+def find_size_table(html, parser=None):
+    """
+    return size_table of a product page, None if missing
+    """
+    soup = make_soup(html, SIZE_TABLE_ONLY, parser)
+    return soup.find("table", id="size_table")
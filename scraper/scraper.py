@@ -1,12 +1,70 @@
 import os
-import uuid
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
 import requests
+from scraper.client import get_client
+from scraper.parsing import find_review_list, make_soup
+from scraper.spool import image_hash, spool_image
 
-def parse_review_page(review_list, size_names, start_idx, max_photos):
-    photo_idx = start_idx
+# number of review images downloaded at the same time
+DOWNLOAD_CONCURRENCY = int(os.getenv("SCRAPER_DOWNLOAD_CONCURRENCY", "8"))
+
+
+def download_image(img_url, cached=False):
+    """
+    return image content, None if the request failed
+    cached: go through the disk http cache (product images, not review images)
+    """
+    client = get_client()
+    try:
+        r = client.get_cached(img_url) if cached else client.get(img_url)
+    except requests.RequestException as e:
+        print(f"get image request failed on url: {img_url}")
+        print(e, end="\n\n")
+        return None
+
+    if r.status_code != 200:
+        print(f"get image request failed on url: {r.url}")
+        print(f"response code: {r.status_code}", end="\n\n")
+        return None
+    return r.content
+
+
+def download_images(img_urls, concurrency=DOWNLOAD_CONCURRENCY):
+    """
+    download images concurrently, at most concurrency requests in flight
+    return list of image content aligned with img_urls, None for failed downloads
+    """
+    if len(img_urls) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(download_image, img_urls))
+
+
+def review_image_url(review_div):
+    """
+    absolute url of the first photo of a review, None for a review with no image
+    the photo url identifies a review in the listing
+    """
+    img_list_tag = review_div.find("ul", "review-content-photo__list")
+    if img_list_tag is None:
+        return None
+    img_tag = img_list_tag.find("img")  # first image of review
+    if img_tag is None or not img_tag.get("src"):
+        return None
+    return urljoin("https:", str(img_tag["src"]))
+
+
+def parse_review_list(review_list, size_names, max_reviews, skip_urls=frozenset()):
+    """
+    parse stage: read body size, product option, content and first image url of each review
+    skip_urls: image urls of reviews already stored
+    """
     reviews = []
     for review_div in review_list:
+        if len(reviews) >= max_reviews:
+            break
+
         # read body size info
         body_size_tag = review_div.find("p", "review-profile__body_information")
         if body_size_tag is None:
@@ -39,31 +97,13 @@ def parse_review_page(review_list, size_names, start_idx, max_photos):
         review_content = str(review_div.find("div", "review-contents__text").text).strip()
 
         # save only first photo
-        img_list_tag = review_div.find("ul", "review-content-photo__list")
-        if img_list_tag is None: 
+        img_url = review_image_url(review_div)
+        if img_url is None:
             # review with no image
             continue
-        img_tag = img_list_tag.find("img") # first image of review
-
-        # download review image
-        img_url = "https:" + str(img_tag["src"])
-        r = requests.get(img_url)
-        if r.status_code != 200:
-            print(f"get image request failed on url: {r.url}")
-            print(f"response code: {r.status_code}", end="\n\n")
-            return ([], photo_idx)
-
-        img_content = r.content
-        img_dir = os.getcwd()
-        temp_dir = os.path.join(img_dir, "temp")
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-        
-        img_name = str(uuid.uuid4()) + ".jpg"
-        img_path = os.path.join(temp_dir, img_name)
-        with open(img_path, "wb") as f:
-            f.write(img_content)
-        full_img_path = str(os.path.abspath(img_path))
+        if img_url in skip_urls:
+            # review already stored
+            continue
 
         # fill in and add review_size dict
         review_size = {}
@@ -72,15 +112,30 @@ def parse_review_page(review_list, size_names, start_idx, max_photos):
         review_size["height"] = body_size_info[1][:-2]
         review_size["weight"] = body_size_info[2][:-2]
         review_size["product_size"] = product_size
-        review_size["image"] = full_img_path
+        review_size["source_url"] = img_url
+        review_size["image"] = img_url
 
         reviews.append(review_size)
-        photo_idx += 1
 
-        if photo_idx >= max_photos:
-            break
+    return reviews
+
+
+def parse_review_page(review_list, size_names, start_idx, max_photos, skip_urls=frozenset()):
+    # parse stage: collect the reviews and their image urls
+    reviews = parse_review_list(review_list, size_names, max_photos - start_idx, skip_urls)
 
-    return (reviews, photo_idx)
+    # download stage: fetch the review images concurrently
+    img_contents = download_images([review["image"] for review in reviews])
+
+    downloaded = []
+    for review_size, img_content in zip(reviews, img_contents):
+        if img_content is None:
+            continue
+        review_size["image_hash"] = image_hash(img_content)
+        review_size["image"] = spool_image(img_content, review_size["image_hash"])
+        downloaded.append(review_size)
+
+    return (downloaded, start_idx + len(downloaded))
         
 
 def to_size_dict_list(size_table):
@@ -175,47 +230,142 @@ def to_size_dict_list(size_table):
 
     return ret
 
-def parse_reviews(product_id, size_names, max_photos):
-    # Given product_id of product, get review photo, size, contents
-    url = "https://goods.musinsa.com/api/goods/v2/review/style/list"
+ITEM_URL = "https://www.musinsa.com/app/goods/"
+REVIEW_LIST_URL = "https://goods.musinsa.com/api/goods/v2/review/style/list"
+
+# review list orders
+SORT_POPULAR = "up_cnt_desc"
+SORT_NEW = "new"
+
+
+def fetch_review_list_page(product_id, page, sort=SORT_POPULAR):
     params = {
-        "sort": "up_cnt_desc",
+        "sort": sort,
         "selectedSimilarNo": product_id,
         "goodsNo": product_id,
+        "page": page,
     }
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36 Edg/118.0.2088.76"
-    }
+    response = get_client().get(REVIEW_LIST_URL, params=params)
+    response.raise_for_status()
+    return response.content
+
+
+def parse_reviews(
+    product_id,
+    size_names,
+    max_photos,
+    prefetch=True,
+    sort=SORT_POPULAR,
+    stop_at=None,
+    skip_urls=frozenset(),
+):
+    # Given product_id of product, get review photo, size, contents
+    # same as parse_review_listing() without the listing progress
+    reviews, _ = parse_review_listing(
+        product_id, size_names, max_photos, prefetch, sort, stop_at, skip_urls
+    )
+    return reviews
 
+
+def parse_review_listing(
+    product_id,
+    size_names,
+    max_photos,
+    prefetch=True,
+    sort=SORT_POPULAR,
+    stop_at=None,
+    skip_urls=frozenset(),
+    skip_range=None,
+):
+    # Given product_id of product, get review photo, size, contents, and how far the listing was read
+    # prefetch: fetch page N+1 while page N is parsed and its images are downloaded
+    # stop_at: image url of a review seen before, listing stops at it (with sort=SORT_NEW, reviews after it are older)
+    # skip_urls: image urls of reviews already stored, not downloaded again
+    # skip_range: (newest, oldest) image urls of a part of the listing read before, skipped without downloading
+    # return: reviews, {
+    #     "newest": image url of the first review of the listing,
+    #     "oldest": image url of the last review returned,
+    #     "complete": True if the listing was read down to stop_at or its end,
+    #                 False if max_photos or a page without a review list (error page, markup change) stopped it,
+    # }
     reviews = []
     page = 1  # review pagination
     review_num = 0  # 'number' in review_size.json
-    while True:
-        params["page"] = page
-        response = requests.get(url, params, headers=headers)
-        response.raise_for_status()
-
-        html = response.content
-        soup = BeautifulSoup(html, "html.parser")
-        review_list = soup.find("div", "review-list-wrap").find_all(
-            "div", "review-list"
-        )
-        if len(review_list) == 0:
-            break
+    newest = None
+    complete = False
+    in_skip_range = False
+    skip_range_passed = skip_range is None
 
-        print(f"Parsing reviews {review_num}/{max_photos}")
-
-        more_reviews, next_review_num = parse_review_page(
-            review_list, size_names, review_num, max_photos
-        )
-        reviews += more_reviews
-        review_num = next_review_num
-        page += 1
+    prefetcher = ThreadPoolExecutor(max_workers=1)
+    next_page = prefetcher.submit(fetch_review_list_page, product_id, page, sort)
+    try:
+        while True:
+            html = next_page.result()
+            next_page = None
+
+            review_list = find_review_list(html)
+            if review_list is None:
+                # not a review list page: the rest of the listing is unread
+                print(f"no review list on page {page} of product {product_id}, listing not complete")
+                break
+            if len(review_list) == 0:
+                # end of the listing
+                complete = True
+                break
+
+            img_urls = [review_image_url(review_div) for review_div in review_list]
+            if newest is None:
+                newest = next((url for url in img_urls if url is not None), None)
+
+            reached_stop = False
+            if stop_at is not None and stop_at in img_urls:
+                review_list = review_list[: img_urls.index(stop_at)]
+                img_urls = img_urls[: len(review_list)]
+                reached_stop = True
+
+            if not skip_range_passed:
+                # drop the reviews from skip_range[0] down to skip_range[1], possibly over several pages
+                kept = []
+                for review_div, img_url in zip(review_list, img_urls):
+                    if img_url is not None and img_url == skip_range[0]:
+                        in_skip_range = True
+                    if not in_skip_range:
+                        kept.append(review_div)
+                    elif img_url is not None and img_url == skip_range[1]:
+                        in_skip_range = False
+                        skip_range_passed = True
+                review_list = kept
+
+            if prefetch and not reached_stop:
+                next_page = prefetcher.submit(fetch_review_list_page, product_id, page + 1, sort)
+
+            print(f"Parsing reviews {review_num}/{max_photos}")
+
+            more_reviews, next_review_num = parse_review_page(
+                review_list, size_names, review_num, max_photos, skip_urls
+            )
+            reviews += more_reviews
+            review_num = next_review_num
+            page += 1
+
+            if next_review_num >= max_photos:
+                # reviews of the page after the last one returned may be unread
+                break
+            if reached_stop:
+                complete = True
+                break
+
+            if not prefetch:
+                next_page = prefetcher.submit(fetch_review_list_page, product_id, page, sort)
+    finally:
+        # drop the prefetched page not needed anymore, without waiting for an in-flight request
+        if next_page is not None:
+            next_page.cancel()
+        prefetcher.shutdown(wait=False, cancel_futures=True)
+
+    oldest = reviews[-1]["source_url"] if len(reviews) > 0 else None
+    return reviews, {"newest": newest, "oldest": oldest, "complete": complete}
 
-        if next_review_num >= max_photos:
-            break
-    
-    return reviews
 
 def parse_item_page(soup):
     item = dict()
@@ -237,13 +387,10 @@ def parse_item_page(soup):
     img_url = img_tag["src"]
     img_url = "https:" + img_url
 
-    r = requests.get(img_url)
-    if r.status_code != 200:
-        print(f"get image request failed on url: {r.url}")
-        print(f"response code: {r.status_code}", end="\n\n")
+    img_content = download_image(img_url, cached=True)
+    if img_content is None:
         return None
 
-    img_content = r.content
     item["image"] = img_content
 
     # product name
@@ -271,19 +418,20 @@ def parse_item_page(soup):
 def parse_item(product_id):
     pid = str(product_id)
 
-    BASE_URL = "https://www.musinsa.com/app/goods/"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36 Edg/118.0.2088.76"
-    }
     # make GET request to product page
-    url = BASE_URL + pid
-    response = requests.get(url, headers=headers)
+    url = ITEM_URL + pid
+    try:
+        response = get_client().get_cached(url)
+    except requests.RequestException as e:
+        print(f"request failed on url: {url}")
+        print(e, end="\n\n")
+        return None
     if response.status_code != 200:
         print(f"request failed on url: {response.url}")
         print(f"response code: {response.status_code}", end="\n\n")
         return None
     
     html = response.content
-    product_soup = BeautifulSoup(html, "html.parser")
+    product_soup = make_soup(html)
 
     return parse_item_page(product_soup)
\ No newline at end of file
@@ -0,0 +1,114 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# content addressed store of scraped images waiting for estimation, shared by the scrape and estimate workers.
+# every chain gets its own reference (a hard link) to the shared entry of an image and releases only that one.
+# keep it on the same filesystem as MEDIA_ROOT so saved images are hard linked instead of copied
+SPOOL_DIR = os.path.abspath(os.getenv("SCRAPER_SPOOL_DIR") or os.path.join(BASE_DIR, "spool"))
+# spooled images of chains that failed before save_result are removed after SPOOL_MAX_AGE seconds
+SPOOL_MAX_AGE = float(os.getenv("SCRAPER_SPOOL_MAX_AGE", str(6 * 3600)))
+
+
+def image_hash(img_content):
+    """
+    sha256 hex digest of image content, the spool file name and the Estimation key
+    """
+    return hashlib.sha256(img_content).hexdigest()
+
+
+def spool_path(digest, spool_dir=SPOOL_DIR):
+    return os.path.join(spool_dir, digest[:2], digest + ".jpg")
+
+
+def spool_image(img_content, digest=None, spool_dir=SPOOL_DIR):
+    """
+    write image content to the spool once, named by its sha256 (digest if already computed)
+    return absolute path of a new reference to the spooled image, owned by the caller until release()
+    """
+    digest = digest or image_hash(img_content)
+    path = spool_path(digest, spool_dir)
+    ref = os.path.join(os.path.dirname(path), f"{digest}.{uuid.uuid4().hex}.jpg")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    try:
+        link_or_copy(path, ref)
+        # hard links share the mtime, refresh it so the image is not cleaned up under the new chain
+        os.utime(ref)
+        return ref
+    except FileNotFoundError:
+        # not spooled yet, or removed by cleanup_spool() meanwhile
+        pass
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(img_content)
+        link_or_copy(tmp_path, ref)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return ref
+
+
+def release(path):
+    """
+    remove a reference returned by spool_image(), the shared entry and the references of other chains are
+    kept until cleanup_spool(), files already linked into MEDIA_ROOT are kept
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        # spool on another filesystem
+        shutil.copyfile(src, dst)
+
+
+def save_spooled_image(field_file, path):
+    """
+    put a spooled image into a django FileField (FileSystemStorage) by hard linking it, without reading it
+    the model instance is not saved
+    """
+    storage = field_file.storage
+    name = field_file.field.generate_filename(field_file.instance, str(uuid.uuid4()) + ".jpg")
+    name = storage.get_available_name(name)
+    dst = storage.path(name)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    link_or_copy(path, dst)
+    field_file.name = name
+
+
+def cleanup_spool(max_age=SPOOL_MAX_AGE, spool_dir=SPOOL_DIR):
+    """
+    remove spooled images, references of chains that never released them and interrupted writes
+    older than max_age seconds
+    return number of removed files
+    """
+    removed = 0
+    now = time.time()
+    for root, _, files in os.walk(spool_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
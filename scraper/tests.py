@@ -0,0 +1,150 @@
+import glob
+import os
+from unittest import mock
+
+from bs4 import BeautifulSoup
+from django.test import SimpleTestCase
+
+from scraper.parsing import find_review_list, find_size_table, make_soup
+from scraper.scraper import (
+    parse_item_page,
+    parse_review_listing,
+    parse_review_list,
+    to_size_dict_list,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def available_parsers():
+    parsers = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return parsers
+    return parsers + ["lxml"]
+
+
+def fixtures(pattern):
+    paths = sorted(glob.glob(os.path.join(FIXTURES_DIR, pattern)))
+    assert paths, f"no fixture matches {pattern}"
+    for path in paths:
+        with open(path, "rb") as f:
+            yield os.path.basename(path), f.read()
+
+
+# parsing before SoupStrainer / lxml: full html.parser tree
+
+
+def old_size_table(html):
+    return BeautifulSoup(html, "html.parser").find("table", id="size_table")
+
+
+def old_review_list(html):
+    review_list_wrap = BeautifulSoup(html, "html.parser").find("div", "review-list-wrap")
+    if review_list_wrap is None:
+        return None
+    return review_list_wrap.find_all("div", "review-list")
+
+
+def size_names():
+    # every size of the products in the fixtures, so no review is dropped for its option
+    names = set()
+    for _, html in fixtures("item_*.html"):
+        names.update(size["size"] for size in to_size_dict_list(old_size_table(html)))
+    return names
+
+
+class ParserParityTest(SimpleTestCase):
+    """
+    The partial trees (find_size_table, find_review_list) extract the same data as the full html.parser tree
+    on saved Musinsa responses (python -m scraper.capture_fixtures <product_id>)
+    """
+
+    def test_size_table(self):
+        for name, html in fixtures("item_*.html"):
+            expected = to_size_dict_list(old_size_table(html))
+            self.assertIsNotNone(expected, name)
+            for parser in available_parsers():
+                with self.subTest(fixture=name, parser=parser):
+                    self.assertEqual(to_size_dict_list(find_size_table(html, parser)), expected)
+
+    @mock.patch(
+        "scraper.scraper.download_image", side_effect=lambda url, cached=False: url.encode()
+    )
+    def test_item_page(self, download_image):
+        # option box, product image, name and brand; the image URL stands in for the downloaded image
+        for name, html in fixtures("item_*.html"):
+            expected = parse_item_page(BeautifulSoup(html, "html.parser"))
+            self.assertIsNotNone(expected, name)
+            for parser in available_parsers():
+                with self.subTest(fixture=name, parser=parser):
+                    self.assertEqual(parse_item_page(make_soup(html, parser=parser)), expected)
+
+    def test_review_list(self):
+        names = size_names()
+        for name, html in fixtures("review_list_*.html"):
+            old = old_review_list(html)
+            expected = None if old is None else parse_review_list(old, names, len(old))
+            for parser in available_parsers():
+                with self.subTest(fixture=name, parser=parser):
+                    new = find_review_list(html, parser)
+                    self.assertEqual(new is None, old is None)
+                    if old is None:
+                        continue
+                    self.assertEqual(len(new), len(old))
+                    self.assertEqual(parse_review_list(new, names, len(new)), expected)
+
+    def test_fixtures_cover_reviews(self):
+        # at least one page with parsed reviews, one empty last page and one page without a review list
+        names = size_names()
+        counts = []
+        for _, html in fixtures("review_list_*.html"):
+            old = old_review_list(html)
+            counts.append(None if old is None else len(parse_review_list(old, names, len(old))))
+        self.assertIn(None, counts)
+        self.assertIn(0, counts)
+        self.assertTrue(any(count for count in counts if count))
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+class ReviewListingTest(SimpleTestCase):
+    """
+    parse_review_listing() over fixture pages, without downloading or spooling the review images
+    """
+
+    def read_listing(self, pages, **kwargs):
+        with mock.patch(
+            "scraper.scraper.fetch_review_list_page",
+            side_effect=lambda product_id, page, sort: fixture(pages[page - 1]),
+        ), mock.patch(
+            "scraper.scraper.download_images", side_effect=lambda urls: [url.encode() for url in urls]
+        ), mock.patch(
+            "scraper.scraper.spool_image", side_effect=lambda content, digest: content.decode()
+        ):
+            return parse_review_listing(1234567, size_names(), max_photos=100, **kwargs)
+
+    def test_end_of_listing(self):
+        reviews, progress = self.read_listing(
+            ["review_list_1234567_new_1.html", "review_list_1234567_new_end.html"]
+        )
+        self.assertTrue(reviews)
+        self.assertTrue(progress["complete"])
+        self.assertEqual(progress["oldest"], reviews[-1]["source_url"])
+
+    def test_error_page_is_not_end_of_listing(self):
+        # the high-water mark must not move past the reviews after the error page
+        reviews, progress = self.read_listing(
+            ["review_list_1234567_new_1.html", "review_list_1234567_error.html"]
+        )
+        self.assertTrue(reviews)
+        self.assertFalse(progress["complete"])
+        self.assertEqual(progress["oldest"], reviews[-1]["source_url"])
+
+        reviews, progress = self.read_listing(["review_list_1234567_error.html"])
+        self.assertEqual(reviews, [])
+        self.assertEqual(progress, {"newest": None, "oldest": None, "complete": False})